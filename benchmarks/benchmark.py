@@ -0,0 +1,373 @@
+"""Micro-benchmarks for the code running on every Telegram message
+
+Runs offline against a synthetic (or recorded) CoinGecko market snapshot and
+compares the results with benchmarks/baseline.json.
+
+    python benchmarks/benchmark.py                 # compare with the baseline
+    python benchmarks/benchmark.py --save          # store a new baseline
+    python benchmarks/benchmark.py -k topcoin      # only matching benchmarks
+    python benchmarks/benchmark.py --record market.json
+    python benchmarks/benchmark.py --market market.json
+
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import numpy as np
+import pandas as pd
+
+import fakecoingecko
+import marketdata
+import signals
+import tgparser
+
+from config import Config
+from multibot import MultiBot
+from ratelimit import coingecko
+from signals import Signals, topcoin_cache
+from singlebot import SingleBot
+
+BASELINE = os.path.join(HERE, "baseline.json")
+CONFIG = os.path.join(HERE, "config.ini")
+
+SIGNAL = (
+    "🚀 3CQS Signal 🚀\n"
+    "Super Volatility\n"
+    "#ADA\n"
+    "BOT_START\n"
+    "Volatility Score 3.21\n"
+    "Price Action Score 1.87\n"
+    "SymRank #8"
+)
+
+SYMRANK = "🏆 SymRank Top 30 🏆\n" + "\n".join(
+    str(rank) + ". " + symbol.upper()
+    for rank, symbol in enumerate(fakecoingecko.SYMBOLS[:16], 1)
+)
+
+CHAT = "Good morning everyone, BTC looks strong today!"
+
+benchmarks = []
+
+
+def benchmark(name):
+    # Registers a setup function returning the callable to measure
+    def register(setup):
+        benchmarks.append((name, setup))
+        return setup
+
+    return register
+
+
+def symrank_pairs(count):
+    # Mix of ranked coins and tokens CoinGecko does not know
+    pairs = [symbol.upper() for symbol in fakecoingecko.SYMBOLS]
+    pairs += [
+        coin["symbol"].upper() for coin in fakecoingecko.FakeCoinGeckoAPI.markets[50:]
+    ]
+    pairs = pairs[:count]
+    pairs[-1] = "NOTLISTED"
+
+    return pairs
+
+
+def topcoin_signals(cache=0):
+    # Signals with the topcoin decision cache disabled or enabled for seconds
+    topcoin_cache.configure(cache)
+    return Signals(logger)
+
+
+def ema_loop(data, period, smoothing=2):
+    # Previous list based Signals.ema, reference for the vectorized version
+    ema = [sum(data[:period]) / period]
+
+    for price in data[period:]:
+        ema.append(
+            (price * (smoothing / (1 + period)))
+            + ema[-1] * (1 - (smoothing / (1 + period)))
+        )
+
+    for i in range(period - 1):
+        ema.insert(0, np.nan)
+
+    return ema
+
+
+def technical(signal, btcusdt):
+    # Previous DataFrame based indicators of the btc-pulse, reference for the
+    # CandleBuffer
+    btcusdt = btcusdt.iloc[:, :5]
+    btcusdt.columns = ["Time", "Open", "High", "Low", "Close"]
+    btcusdt = btcusdt.astype(float)
+    btcusdt["EMA9"] = signal.ema(btcusdt["Close"], 9)
+    btcusdt["EMA50"] = signal.ema(btcusdt["Close"], 50)
+    btcusdt["per_5mins"] = (np.log(btcusdt["Close"].pct_change() + 1)) * 100
+    btcusdt["percentchange_15mins"] = (np.log(btcusdt["Close"].pct_change(3) + 1)) * 100
+
+    return btcusdt
+
+
+def chart(rows=72, seed=1, freq="5min"):
+    # Candles (default 5 minutes) in the column layout of yfinance
+    rng = np.random.default_rng(seed)
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.002, rows)))
+    index = pd.date_range("2022-05-01", periods=rows, freq=freq)
+
+    return pd.DataFrame(
+        {
+            "Open": close * 0.999,
+            "High": close * 1.001,
+            "Low": close * 0.998,
+            "Close": close,
+            "Adj Close": close,
+            "Volume": rng.integers(1e8, 1e9, rows),
+        },
+        index=index,
+    )
+
+
+def settings():
+    return Config(CONFIG)
+
+
+@benchmark("parse_signal")
+def parse_signal():
+    return lambda: tgparser.parse(SIGNAL, "USDT")
+
+
+@benchmark("parse_symrank")
+def parse_symrank():
+    return lambda: tgparser.parse(SYMRANK, "USDT")
+
+
+@benchmark("parse_chat")
+def parse_chat():
+    return lambda: tgparser.parse(CHAT, "USDT")
+
+
+@benchmark("topcoin_single")
+def topcoin_single():
+    signal = topcoin_signals()
+    return lambda: signal.topcoin("USDT_ADA", 200, 0, "binance", "USDT")
+
+
+@benchmark("topcoin_single_volume")
+def topcoin_single_volume():
+    signal = topcoin_signals()
+    return lambda: signal.topcoin("USDT_ADA", 200, 0.1, "binance", "USDT")
+
+
+@benchmark("topcoin_30")
+def topcoin_30():
+    signal = topcoin_signals()
+    pairs = symrank_pairs(30)
+    return lambda: signal.topcoin(pairs, 3500, 0, "binance", "USDT")
+
+
+@benchmark("topcoin_100")
+def topcoin_100():
+    signal = topcoin_signals()
+    pairs = symrank_pairs(100)
+    return lambda: signal.topcoin(pairs, 3500, 0, "binance", "USDT")
+
+
+@benchmark("topcoin_100_volume")
+def topcoin_100_volume():
+    signal = topcoin_signals()
+    pairs = symrank_pairs(100)
+    return lambda: signal.topcoin(pairs, 3500, 0.1, "binance", "USDT")
+
+
+@benchmark("topcoin_single_cached")
+def topcoin_single_cached():
+    signal = topcoin_signals(600)
+    return lambda: signal.topcoin("USDT_ADA", 200, 0.1, "binance", "USDT")
+
+
+@benchmark("topcoin_100_cached")
+def topcoin_100_cached():
+    signal = topcoin_signals(600)
+    pairs = symrank_pairs(100)
+    return lambda: signal.topcoin(pairs, 3500, 0.1, "binance", "USDT")
+
+
+@benchmark("ema_72")
+def ema_72():
+    signal = Signals(logger)
+    close = chart()["Close"]
+    return lambda: signal.ema(close, 9)
+
+
+@benchmark("ema_3d_1m")
+def ema_3d_1m():
+    signal = Signals(logger)
+    close = chart(4320, freq="1min")["Close"]
+    return lambda: signal.ema(close, 50)
+
+
+@benchmark("ema_3d_1m_loop")
+def ema_3d_1m_loop():
+    close = chart(4320, freq="1min")["Close"]
+    return lambda: ema_loop(close, 50)
+
+
+@benchmark("btctechnical")
+def btctechnical():
+    signal = Signals(logger)
+    data = chart()
+    return lambda: technical(signal, data)
+
+
+@benchmark("btcpulse_candle")
+def btcpulse_candle():
+    # New candle for the seeded buffer plus the values of the btc-pulse check
+    signal = Signals(logger)
+    data = chart()
+    candles = signal.candles["BTC"]
+    candles.update(data)
+    times = itertools.count(candles.last + 300, 300)
+    close = candles.close()
+
+    def update():
+        candles.append(next(times), close)
+        return (
+            candles.change(3),
+            candles.ema(9),
+            candles.ema(50),
+            candles.ema(50, -2),
+            candles.ema(9, -2),
+        )
+
+    return update
+
+
+@benchmark("btcpulse_replay_1d")
+def btcpulse_replay_1d():
+    # Complete btc-pulse over one day of 5 minute candles from a CSV file
+    data = chart(72 + 288)
+    filename = os.path.join(tempfile.mkdtemp(), "btcusd.csv")
+    data["Close"].to_csv(filename, index_label="time")
+
+    state = type("", (), {})()
+    state.btcbool = True
+    attributes = settings()
+
+    def replay():
+        signal = Signals(logger, marketdata.FileProvider(filename))
+        asyncio.run(signal.getbtcbool(state, attributes))
+        return state.btcbool
+
+    return replay
+
+
+@benchmark("singlebot_payload")
+def singlebot_payload():
+    parsed = tgparser.parse(SIGNAL, "USDT")
+    bot = SingleBot(parsed, None, {"id": 1}, settings(), None, logger)
+    return lambda: bot.payload(parsed.pair, True)
+
+
+@benchmark("multibot_payload")
+def multibot_payload():
+    pairs = ["USDT_" + pair for pair in symrank_pairs(30)]
+    bot = MultiBot(pairs, None, {"id": 1}, pairs, settings(), None, logger)
+    return lambda: bot.payload(pairs, 30, True)
+
+
+def measure(func, repeat):
+    # Best time per call in microseconds
+    func()
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * 0.2 / max(elapsed, 1e-9)))
+
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", dest="filter", default="", help="run matching only")
+    parser.add_argument("--save", action="store_true", help="store a new baseline")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slowdown against the baseline (default 0.25 = 25%%)",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="timing repeats")
+    parser.add_argument("--market", help="recorded CoinGecko snapshot (JSON)")
+    parser.add_argument("--record", help="record the CoinGecko snapshot and exit")
+    args = parser.parse_args()
+
+    if args.record:
+        market = fakecoingecko.record(args.record)
+        print("Recorded " + str(len(market)) + " coins to " + args.record)
+        return 0
+
+    if args.market:
+        fakecoingecko.FakeCoinGeckoAPI.use(fakecoingecko.load(args.market))
+    else:
+        fakecoingecko.FakeCoinGeckoAPI.use(fakecoingecko.synthetic_markets())
+
+    signals.CoinGeckoAPI = fakecoingecko.FakeCoinGeckoAPI
+    coingecko.configure(0)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    results = {}
+    regressions = []
+
+    print("%-24s %12s %12s %8s" % ("benchmark", "us/call", "baseline", "change"))
+
+    for name, setup in benchmarks:
+        if args.filter not in name:
+            continue
+
+        results[name] = round(measure(setup(), args.repeat), 3)
+        line = "%-24s %12.3f" % (name, results[name])
+
+        if name in baseline:
+            change = results[name] / baseline[name] - 1
+            line += " %12.3f %+7.1f%%" % (baseline[name], change * 100)
+
+            if change > args.tolerance:
+                regressions.append(name)
+                line += " REGRESSION"
+
+        print(line)
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, "w") as file:
+            json.dump(baseline, file, indent=4, sort_keys=True)
+            file.write("\n")
+        print("Baseline saved to " + args.baseline)
+        return 0
+
+    if regressions:
+        print("Slower than the baseline: " + ", ".join(regressions))
+        return 1
+
+    return 0
+
+
+logging.basicConfig(level=logging.CRITICAL)
+logger = logging.getLogger("benchmark")
+
+if __name__ == "__main__":
+    sys.exit(main())
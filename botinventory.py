@@ -0,0 +1,217 @@
+import asyncio
+import math
+import sys
+
+
+class BotInventory:
+    """In-process copy of the 3Commas bot list
+
+    The list is loaded once at startup, refreshed in the background and updated in
+    place with the bot objects returned by create/update/enable/disable/delete calls,
+    so that a signal only needs a dictionary lookup instead of paging through /bots.
+
+    Parameters:
+    attributes (Config): Bot configuration
+    p3cw (AsyncPy3CW): Awaitable 3Commas client
+    logging: Logging facility
+
+    """
+
+    def __init__(self, attributes, p3cw, logging):
+        self.attributes = attributes
+        self.p3cw = p3cw
+        self.logging = logging
+        self.bots = {}
+        self.names = {}
+        self.updated_at = ""
+        # Ids of bots deleted by this script, late responses must not restore them
+        self.removed = set()
+
+    def __iter__(self):
+        return iter(list(self.bots.values()))
+
+    def __len__(self):
+        return len(self.bots)
+
+    def get(self, name):
+        # Returns the bot with the given name or None
+        botid = self.names.get(name)
+
+        if botid is None:
+            return None
+
+        return self.bots.get(botid)
+
+    def update(self, bot):
+        # Stores a bot object returned by the 3Commas api, unless it is older than
+        # the stored one (e.g. a slow /bots response after a write-through update)
+        if not isinstance(bot, dict) or "id" not in bot or bot["id"] in self.removed:
+            return
+
+        old = self.bots.get(bot["id"])
+        if old and bot.get("updated_at", "") < old.get("updated_at", ""):
+            return
+
+        if old and old["name"] != bot["name"]:
+            self.names.pop(old["name"], None)
+
+        self.bots[bot["id"]] = bot
+        self.names[bot["name"]] = bot["id"]
+
+    def watermark(self, bots):
+        # Newest updated_at of a /bots response, refresh() fetches the changes
+        # after it. Write-through responses must not move it past changes made
+        # outside of this script
+        for bot in bots:
+            if bot.get("updated_at", "") > self.updated_at:
+                self.updated_at = bot["updated_at"]
+
+    def remove(self, bot):
+        # Forgets a deleted bot
+        self.removed.add(bot["id"])
+        old = self.bots.pop(bot["id"], None)
+
+        if old:
+            self.names.pop(old["name"], None)
+
+    async def fetch(self, offset, sort=False):
+        payload = {"limit": 100, "offset": offset}
+
+        if sort:
+            payload.update({"sort_by": "updated_at", "sort_direction": "desc"})
+
+        return await self.p3cw.request(
+            entity="bots",
+            action="",
+            additional_headers={"Forced-Mode": self.attributes.settings.trade_mode},
+            payload=payload,
+        )
+
+    async def fetchall(self, pages):
+        # Fetches all pages in parallel (limited by bot_fetch_concurrency)
+        # and merges them in offset order
+        concurrency = self.attributes.settings.bot_fetch_concurrency
+        semaphore = asyncio.Semaphore(concurrency)
+        lastpage = [pages]
+
+        async def fetchpage(page):
+            async with semaphore:
+                # Pages behind a partial page are empty anyway
+                if page > lastpage[0]:
+                    return {}, []
+
+                error, data = await self.fetch(page * 100)
+
+                if not error and len(data) < 100:
+                    lastpage[0] = min(lastpage[0], page)
+
+                return error, data
+
+        if concurrency <= 1:
+            results = []
+            for page in range(pages):
+                results.append(await fetchpage(page))
+                if results[-1][0] or page >= lastpage[0]:
+                    break
+        else:
+            results = await asyncio.gather(*[fetchpage(page) for page in range(pages)])
+
+        bots = []
+
+        for error, data in results:
+            if error:
+                return error, []
+
+            bots += data
+
+            if len(data) < 100:
+                break
+
+        return {}, bots
+
+    async def load(self, exit_on_error=True):
+        # Gets information about all existing bots in 3Commas
+        botlimit = self.attributes.settings.system_bot_value
+        pages = math.ceil(botlimit / 100)
+        # Bots added while fetching are kept even if the response misses them
+        known = set(self.bots)
+        error, bots = await self.fetchall(pages)
+
+        if error:
+            if exit_on_error:
+                sys.exit(error["msg"])
+
+            self.logging.error(
+                "Refreshing bot inventory failed, keeping old data: " + error["msg"]
+            )
+            return False
+
+        for bot in bots:
+            self.update(bot)
+        self.watermark(bots)
+
+        if len(bots) < pages * 100:
+            # Complete list, bots missing in it were deleted outside of this script
+            for botid in known - {bot["id"] for bot in bots}:
+                if botid in self.bots:
+                    self.remove(self.bots[botid])
+
+        self.logging.debug("Bot inventory loaded with " + str(len(self)) + " bots")
+
+        return True
+
+    async def refresh(self):
+        # Fetches only bots changed since the last refresh (newest first)
+        botlimit = self.attributes.settings.system_bot_value
+        pages = math.ceil(botlimit / 100)
+        since = self.updated_at
+        changed = []
+
+        for page in range(1, pages + 1):
+            error, data = await self.fetch((page - 1) * 100, sort=True)
+
+            if error:
+                self.logging.error("Refreshing bot inventory failed: " + error["msg"])
+                return False
+
+            for bot in data:
+                if bot.get("updated_at", "") <= since:
+                    data = []
+                    break
+
+                self.update(bot)
+                changed.append(bot)
+
+            if len(data) < 100:
+                break
+
+        # Only a complete refresh moves the watermark
+        self.watermark(changed)
+
+        if changed:
+            self.logging.debug(
+                "Bot inventory refreshed with " + str(len(changed)) + " changed bots"
+            )
+
+        return True
+
+    async def run(self):
+        # Keeps the inventory in sync with changes made outside of this script
+        elapsed = 0
+
+        while True:
+            interval = self.attributes.settings.bot_refresh_interval
+
+            if interval <= 0:
+                self.logging.debug("Refreshing of the bot inventory disabled")
+                return
+
+            await asyncio.sleep(interval)
+            elapsed += interval
+
+            if elapsed >= self.attributes.settings.bot_full_refresh_interval:
+                # Full reload catches bots deleted outside of this script
+                elapsed = 0
+                await self.load(exit_on_error=False)
+            else:
+                await self.refresh()
@@ -0,0 +1,303 @@
+import functools
+import json
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict, namedtuple
+
+CacheInfo = namedtuple(
+    "CacheInfo", ["hits", "misses", "stale", "refreshes", "maxsize", "currsize"]
+)
+
+
+class PersistentCache:
+    """JSON values with an expiry date in a SQLite file
+
+    Keeps responses of external APIs over a restart. The file is opened with the
+    first access and entries are read one by one when they are requested. Without
+    a filename every lookup is a miss and nothing is stored.
+
+    Parameters:
+    filename (str): SQLite file, None or "" disables the cache
+
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.db = None
+        self.lock = threading.Lock()
+
+    def open(self, filename):
+        # (Re)configures the cache file, it is opened lazily
+        with self.lock:
+            if self.db:
+                self.db.close()
+
+            self.filename = filename
+            self.db = None
+
+    def connect(self):
+        if self.db is None:
+            self.db = sqlite3.connect(self.filename, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self.db.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+            self.db.commit()
+
+        return self.db
+
+    def get(self, key):
+        # Returns (value, expires) of a valid entry, otherwise None
+        if not self.filename:
+            return None
+
+        try:
+            with self.lock:
+                row = (
+                    self.connect()
+                    .execute("SELECT value, expires FROM cache WHERE key = ?", (key,))
+                    .fetchone()
+                )
+        except sqlite3.Error:
+            return None
+
+        if row is None or row[1] <= time.time():
+            return None
+
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, expires):
+        if not self.filename:
+            return
+
+        try:
+            with self.lock:
+                db = self.connect()
+                db.execute(
+                    "INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires),
+                )
+                db.commit()
+        except (sqlite3.Error, TypeError, ValueError):
+            pass
+
+    def clear(self):
+        if not self.filename:
+            return
+
+        with self.lock:
+            db = self.connect()
+            db.execute("DELETE FROM cache")
+            db.commit()
+
+
+# Shared by all cached functions, configured with cache_file at startup
+cache = PersistentCache()
+
+
+class TimedCache:
+    """Results of a function with an expiry time per entry
+
+    The least recently used entry is dropped when maxsize is reached. An expired
+    entry is still returned (stale-while-revalidate) while a background thread
+    calls the function again and replaces it. Only a missing entry makes the
+    caller wait. If the refresh fails, the stale entry is kept and the next call
+    tries again.
+
+    Parameters:
+    f: Cached function, its arguments have to be hashable
+    seconds (int): Time to live of an entry
+    maxsize (int): Maximum number of entries
+    persistent (bool): Keep the entries in the persistent cache too. The results
+        have to be JSON serializable - tuples come back as lists
+
+    """
+
+    def __init__(self, f, seconds=600, maxsize=128, persistent=False):
+        self.f = f
+        self.seconds = seconds
+        self.maxsize = maxsize
+        self.persistent = persistent
+        self.entries = OrderedDict()
+        self.refreshing = set()
+        self.loading = {}
+        self.lock = threading.Lock()
+        # Changes when entries are replaced (refreshed) or cleared
+        self.generation = 0
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "refreshes": 0}
+        functools.update_wrapper(self, f)
+
+    def key(self, args, kwargs):
+        return args + tuple(sorted(kwargs.items())) if kwargs else args
+
+    def storekey(self, key):
+        return self.f.__qualname__ + repr(key)
+
+    def lookup(self, key, args, kwargs):
+        # Entry of key or None, the caller holds the lock
+        entry = self.entries.get(key)
+
+        if entry is None:
+            return None
+
+        self.entries.move_to_end(key)
+
+        if entry[1] > time.time():
+            self.stats["hits"] += 1
+            return entry
+
+        # Serve the old value, refresh it once in the background
+        self.stats["stale"] += 1
+        if key not in self.refreshing:
+            self.refreshing.add(key)
+            threading.Thread(
+                target=self.refresh,
+                args=(key, args, kwargs),
+                name="cache-refresh",
+                daemon=True,
+            ).start()
+
+        return entry
+
+    def __call__(self, *args, **kwargs):
+        key = self.key(args, kwargs)
+
+        with self.lock:
+            entry = self.lookup(key, args, kwargs)
+
+            if entry is not None:
+                return entry[0]
+
+            self.stats["misses"] += 1
+            loading = self.loading.setdefault(key, threading.Lock())
+
+        # Concurrent callers of the same missing entry wait for one load
+        with loading:
+            try:
+                with self.lock:
+                    entry = self.entries.get(key)
+
+                if entry is None:
+                    entry = self.load(key, args, kwargs)
+            finally:
+                with self.lock:
+                    self.loading.pop(key, None)
+
+        return entry[0]
+
+    def load(self, key, args, kwargs):
+        if self.persistent:
+            stored = cache.get(self.storekey(key))
+
+            if stored is not None:
+                self.store(key, stored)
+                return stored
+
+        return self.fetch(key, args, kwargs)
+
+    def fetch(self, key, args, kwargs):
+        return self.save(key, self.f(*args, **kwargs))
+
+    def save(self, key, value):
+        entry = (value, time.time() + self.seconds)
+        self.store(key, entry)
+
+        if self.persistent:
+            cache.set(self.storekey(key), entry[0], entry[1])
+
+        return entry
+
+    def refresh(self, key, args, kwargs):
+        try:
+            self.fetch(key, args, kwargs)
+
+            with self.lock:
+                self.stats["refreshes"] += 1
+        except Exception:  # pylint: disable=broad-except
+            pass
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+    def store(self, key, entry):
+        with self.lock:
+            if key in self.entries:
+                self.generation += 1
+
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def get(self, *args, **kwargs):
+        # Cached value (also a stale one) without calling the function, or None
+        key = self.key(args, kwargs)
+
+        with self.lock:
+            entry = self.lookup(key, args, kwargs)
+
+        if entry is None and self.persistent:
+            entry = cache.get(self.storekey(key))
+
+            if entry is not None:
+                self.store(key, entry)
+
+        return entry[0] if entry else None
+
+    def fresh(self, *args, **kwargs):
+        # Cached value which has not expired yet, or None. Unlike get() this never
+        # starts a background refresh, so callers can reload expired entries in
+        # batches themselves
+        key = self.key(args, kwargs)
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and entry[1] > time.time():
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry[0]
+
+        if self.persistent:
+            entry = cache.get(self.storekey(key))
+
+            if entry is not None:
+                self.store(key, entry)
+                return entry[0]
+
+        return None
+
+    def set(self, args, value):
+        # Stores a result loaded outside of the cached function
+        self.save(self.key(tuple(args), {}), value)
+
+    def cache_info(self):
+        with self.lock:
+            return CacheInfo(
+                maxsize=self.maxsize, currsize=len(self.entries), **self.stats
+            )
+
+    def cache_clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+
+def timed_cache(seconds=600, maxsize=128, persistent=False):
+    """Decorator caching a function in a TimedCache
+
+    Parameters:
+    seconds (int): Time to live of an entry, default = 10 minutes
+    maxsize (int): Maximum number of entries
+    persistent (bool): Keep the entries over a restart in the persistent cache
+
+    """
+
+    def wrapper_cache(f):
+        return TimedCache(f, seconds=seconds, maxsize=maxsize, persistent=persistent)
+
+    return wrapper_cache
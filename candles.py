@@ -0,0 +1,140 @@
+import math
+
+import numpy as np
+
+
+class CandleBuffer:
+    """Rolling, fixed-size buffer of candle close prices with incremental EMAs
+
+    The closes, EMAs and timestamps are kept in preallocated NumPy arrays used as
+    ring buffer. Every new candle updates the EMAs in O(1) from the previous
+    values. The EMAs are seeded with the simple average of the first period
+    closes (like Signals.ema) and stay NaN before. A candle with the timestamp
+    of the last one replaces it - the latest candle of a download is usually not
+    closed yet.
+
+    Parameters:
+    size (int): Number of candles kept, older ones are dropped
+    periods (tuple): EMA periods to calculate
+    smoothing (int): Smoothing factor of the EMAs
+
+    """
+
+    def __init__(self, size=72, periods=(9, 50), smoothing=2):
+        self.size = size
+        self.periods = tuple(periods)
+        self.alpha = {period: smoothing / (1 + period) for period in self.periods}
+        self.times = np.zeros(size, dtype=np.int64)
+        self.closes = np.full(size, np.nan)
+        self.emas = {period: np.full(size, np.nan) for period in self.periods}
+        self.clear()
+
+    def clear(self):
+        self.head = -1
+        self.count = 0
+        # Closes appended since the start, for the simple average seeds
+        self.total = 0
+        self.seeds = {period: 0.0 for period in self.periods}
+        # EMAs of the last candle and the one before, to replace the last candle
+        self.current = {period: math.nan for period in self.periods}
+        self.previous = dict(self.current)
+
+    def __len__(self):
+        return self.count
+
+    def index(self, offset):
+        # Array position of offset (-1 = last candle)
+        if not -self.count <= offset < 0:
+            raise IndexError("candle " + str(offset) + " is not in the buffer")
+
+        return (self.head + 1 + offset) % self.size
+
+    @property
+    def last(self):
+        # Timestamp (seconds) of the last candle, None if empty
+        return int(self.times[self.head]) if self.count else None
+
+    def append(self, timestamp, close):
+        """Adds a candle, replaces the last one if it has the same timestamp
+
+        Parameters:
+        timestamp (int): Open time of the candle in seconds
+        close (float): Close price
+
+        Returns:
+        bool: False if the candle is older than the last one and was ignored
+
+        """
+
+        if self.count and timestamp < self.times[self.head]:
+            return False
+
+        if self.count and timestamp == self.times[self.head]:
+            # Undo the last candle, it is calculated again with the new close
+            self.total -= 1
+            for period in self.periods:
+                if self.total + 1 < period:
+                    self.seeds[period] -= self.closes[self.head]
+        else:
+            self.previous = dict(self.current)
+            self.head = (self.head + 1) % self.size
+            self.count = min(self.count + 1, self.size)
+
+        self.times[self.head] = timestamp
+        self.closes[self.head] = close
+        self.total += 1
+
+        for period, emas in self.emas.items():
+            if self.total < period:
+                self.seeds[period] += close
+                ema = math.nan
+            elif self.total == period:
+                ema = (self.seeds[period] + close) / period
+            else:
+                alpha = self.alpha[period]
+                ema = close * alpha + self.previous[period] * (1 - alpha)
+
+            emas[self.head] = self.current[period] = ema
+
+        return True
+
+    def update(self, frame, symbol=None):
+        """Appends the candles of a downloaded chart newer than the last one
+
+        Parameters:
+        frame (DataFrame): Chart in the layout of yfinance (Close column,
+            DatetimeIndex)
+        symbol (str): Ticker of the Close column in a chart of several tickers
+
+        Returns:
+        int: Number of added or replaced candles
+
+        """
+
+        close = frame["Close"]
+        if close.ndim > 1:
+            # Columns of several tickers (or newer yfinance versions) are
+            # (price, ticker)
+            close = close[symbol] if symbol in close.columns else close.iloc[:, 0]
+
+        added = 0
+
+        for time, price in zip(close.index, close.to_numpy(dtype=float)):
+            if not math.isnan(price) and self.append(int(time.timestamp()), price):
+                added += 1
+
+        return added
+
+    def close(self, offset=-1):
+        return float(self.closes[self.index(offset)])
+
+    def ema(self, period, offset=-1):
+        # NaN until period candles were appended
+        return float(self.emas[period][self.index(offset)])
+
+    def change(self, candles=1, offset=-1):
+        # Log return in percent over candles, NaN if the buffer is too short
+        if self.count + offset < candles:
+            return math.nan
+
+        return math.log(self.close(offset) / self.close(offset - candles)) * 100
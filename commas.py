@@ -0,0 +1,34 @@
+import asyncio
+import functools
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncPy3CW:
+    """Awaitable wrapper around the synchronous Py3CW client
+
+    Every request is executed in a bounded thread pool, so the Telethon event loop
+    keeps processing updates while a 3Commas call waits on the network (including
+    the retries and backoff of Py3CW).
+
+    Parameters:
+    p3cw (Py3CW): Configured synchronous 3Commas client
+    workers (int): Maximum number of concurrent 3Commas requests
+
+    """
+
+    def __init__(self, p3cw, workers=4):
+        self.p3cw = p3cw
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="3commas"
+        )
+
+    async def request(self, **kwargs):
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(
+            self.executor, functools.partial(self.p3cw.request, **kwargs)
+        )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
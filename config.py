@@ -1,43 +1,406 @@
+import asyncio
 import configparser
+import importlib.util
+import json
+import os
 import sys
 
+# Marks attributes without a default value
+MANDATORY = object()
+
+# Marks attributes which are only mandatory for futures trading
+FUTURES = object()
+
+# All known attributes with their type and default value. "number" accepts
+# integers and floats, "auto" keeps the type guessed from the value
+SCHEMA = {
+    # General
+    "debug": (bool, False),
+    "log_to_file": (bool, False),
+    "log_file_path": (str, "3cqsbot.log"),
+    "log_file_size": (int, 200000),
+    "log_file_count": (int, 5),
+    "log_format": (str, "text"),
+    "signal_log": (str, ""),
+    "cache_file": (str, "3cqsbot.cache"),
+    # Telegram
+    "api_id": (int, MANDATORY),
+    "api_hash": (str, MANDATORY),
+    "sessionfile": (str, "tgsesssion"),
+    "chatroom": ("auto", "3C Quick Stats"),
+    # 3Commas
+    "key": (str, MANDATORY),
+    "secret": (str, MANDATORY),
+    "timeout": ("number", 3),
+    "retries": (int, 5),
+    "delay_between_retries": ("number", 2.0),
+    "system_bot_value": (int, 300),
+    "api_workers": (int, 4),
+    "bot_refresh_interval": (int, 60),
+    "bot_full_refresh_interval": (int, 900),
+    "bot_fetch_concurrency": (int, 4),
+    "signal_workers": (int, 4),
+    "signal_queue_size": (int, 100),
+    "signal_queue_stats_interval": (int, 300),
+    # DCA bot
+    "prefix": (str, MANDATORY),
+    "subprefix": (str, MANDATORY),
+    "suffix": (str, MANDATORY),
+    "tp": ("number", MANDATORY),
+    "bo": ("number", MANDATORY),
+    "so": ("number", MANDATORY),
+    "os": ("number", MANDATORY),
+    "ss": ("number", MANDATORY),
+    "sos": ("number", MANDATORY),
+    "mad": (int, MANDATORY),
+    "max": (int, MANDATORY),
+    "mstc": (int, MANDATORY),
+    "sdsp": (int, 1),
+    "single": (bool, MANDATORY),
+    "single_count": (int, 0),
+    "btc_min_vol": ("number", 0),
+    "cooldown": ("number", 0),
+    "deals_count": (int, 0),
+    # Trading
+    "market": (str, MANDATORY),
+    "trade_mode": (str, MANDATORY),
+    "account_name": (str, MANDATORY),
+    "delete_single_bots": (bool, False),
+    "singlebot_update": (bool, True),
+    "trailing": (bool, False),
+    "trailing_deviation": ("number", 0.2),
+    "trade_future": (bool, False),
+    "leverage_type": (str, FUTURES),
+    "leverage_value": ("number", FUTURES),
+    "stop_loss_percent": ("number", FUTURES),
+    "stop_loss_type": (str, FUTURES),
+    "stop_loss_timeout_enabled": (bool, FUTURES),
+    "stop_loss_timeout_seconds": (int, FUTURES),
+    # Filter
+    "symrank_signal": (str, MANDATORY),
+    "symrank_limit_min": ("number", 1),
+    "symrank_limit_max": ("number", 100),
+    "volatility_limit_min": ("number", 0.1),
+    "volatility_limit_max": ("number", 100),
+    "price_action_limit_min": ("number", 0.1),
+    "price_action_limit_max": ("number", 100),
+    "topcoin_filter": (bool, False),
+    "topcoin_limit": (int, 3500),
+    "topcoin_volume": ("number", 0),
+    "topcoin_exchange": (str, "binance"),
+    "coingecko_rate_limit": (int, 30),
+    "topcoin_cache": (int, 600),
+    "limit_initial_pairs": (bool, False),
+    "random_pair": (bool, True),
+    "multibot_update_window": (int, 0),
+    "deal_mode": (str, "signal"),
+    "btc_pulse": (bool, False),
+    "btc_pulse_fallback": (str, "downtrend"),
+    "btc_pulse_source": (str, "yfinance"),
+    "btc_pulse_symbols": (list, ("BTC",)),
+    "btc_pulse_rule": (str, "any"),
+    "btc_pulse_debounce": (int, 300),
+    "ext_botswitch": (bool, False),
+    "token_denylist": (list, MANDATORY),
+    "config_reload_interval": (int, 10),
+}
+
+# Attributes only used while starting up. Changing them needs a restart
+RESTART = {
+    "debug",
+    "log_to_file",
+    "log_file_path",
+    "log_file_size",
+    "log_file_count",
+    "log_format",
+    "cache_file",
+    "api_id",
+    "api_hash",
+    "sessionfile",
+    "chatroom",
+    "key",
+    "secret",
+    "timeout",
+    "retries",
+    "delay_between_retries",
+    "api_workers",
+    "signal_workers",
+    "signal_queue_size",
+    "signal_queue_stats_interval",
+    "single",
+    "market",
+    "trade_mode",
+    "account_name",
+    "coingecko_rate_limit",
+    "topcoin_cache",
+    "btc_pulse",
+    "btc_pulse_source",
+    "btc_pulse_symbols",
+    "ext_botswitch",
+    "token_denylist",
+}
+
+
+class Settings:
+    """Validated, read-only snapshot of config.ini
+
+    Every attribute of SCHEMA is a slot holding the already converted value, so
+    reading a setting is a plain attribute access.
+
+    """
+
+    __slots__ = tuple(SCHEMA) + ("__weakref__",)
+
+    def __init__(self, values):
+        for name in SCHEMA:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Settings are read-only - reload config.ini instead")
+
+    def __delattr__(self, name):
+        raise AttributeError("Settings are read-only - reload config.ini instead")
+
 
 class Config:
-    def __init__(self):
+    def __init__(self, filename="config.ini"):
+        self.filename = filename
         self.config = configparser.ConfigParser()
-        self.dataset = self.config.read("config.ini")
+        self.dataset = self.config.read(filename)
         self.fixstrings = ["account_name", "prefix", "subprefix", "suffix"]
 
-    def get(self, attribute, defaultvalue=""):
-        data = ""
-
         if len(self.dataset) != 1:
             sys.tracebacklimit = 0
             sys.exit(
                 "Cannot read config.ini! - Please make sure it exists in the folder where 3cqsbot.py is executed."
             )
 
-        sections = self.config.sections()
+        self.values = self.read(self.config)
+        self.modified = self.stat()
+        data, errors = self.compile(self.values)
+        self.settings = Settings(data)
 
-        for section in sections:
-            if self.config.has_option(section, attribute):
-                raw_value = self.config[section].get(attribute)
+        if errors:
+            sys.tracebacklimit = 0
+            sys.exit("\n".join(errors) + "\nPlease check the readme for configuration.")
 
-                if raw_value:
-                    if attribute in self.fixstrings:
-                        data = raw_value
-                    else:
-                        data = self.check_type(raw_value)
-                    break
+    def get(self, attribute, defaultvalue=""):
+        # Compatibility with the old lookup - use Config.settings instead
+        if attribute in SCHEMA:
+            data = getattr(self.settings, attribute)
+            if data is not None:
+                return data
+        elif attribute in self.values:
+            raw_value = self.values[attribute]
 
-        if data == "" and str(defaultvalue):
-            data = defaultvalue
-        elif data == "" and defaultvalue == "":
-            sys.tracebacklimit = 0
-            sys.exit(
-                "Attribute "
-                + attribute
-                + " is not set, but mandatory! Please check the readme for configuration."
+            if attribute in self.fixstrings:
+                return raw_value
+
+            return self.check_type(raw_value)
+
+        if str(defaultvalue):
+            return defaultvalue
+
+        sys.tracebacklimit = 0
+        sys.exit(
+            "Attribute "
+            + attribute
+            + " is not set, but mandatory! Please check the readme for configuration."
+        )
+
+    def stat(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload(self, logging):
+        # Validates the changed config.ini and swaps the settings snapshot
+        config = configparser.ConfigParser()
+
+        try:
+            if len(config.read(self.filename)) != 1:
+                logging.error("Cannot read config.ini - keeping old settings")
+                return False
+        except configparser.Error as error:
+            logging.error(
+                "Cannot parse config.ini - keeping old settings: " + str(error)
+            )
+            return False
+
+        values = self.read(config)
+        data, errors = self.compile(values)
+
+        if errors:
+            for error in errors:
+                logging.error(error)
+            logging.error("config.ini not reloaded - keeping old settings")
+            return False
+
+        changed = []
+        restart = []
+
+        for attribute in SCHEMA:
+            old = getattr(self.settings, attribute)
+
+            if data[attribute] != old:
+                if attribute in RESTART:
+                    restart.append(attribute)
+                    data[attribute] = old
+                else:
+                    changed.append(attribute)
+
+        self.config = config
+        self.values = values
+        self.settings = Settings(data)
+
+        if changed:
+            logging.info("config.ini reloaded, changed settings: " + ", ".join(changed))
+        if restart:
+            logging.warning(
+                "Changed settings need a restart of 3cqsbot and are ignored until then: "
+                + ", ".join(restart)
+            )
+        if not changed and not restart:
+            logging.debug("config.ini reloaded without changes")
+
+        return True
+
+    async def watch(self, logging):
+        # Reloads config.ini after it has been changed
+        while True:
+            interval = self.settings.config_reload_interval
+
+            if interval <= 0:
+                logging.debug("Reloading of config.ini disabled")
+                return
+
+            await asyncio.sleep(interval)
+
+            modified = self.stat()
+
+            if modified and modified != self.modified:
+                self.modified = modified
+                self.reload(logging)
+
+    def read(self, config):
+        # Flattens all sections, the first non empty value wins
+        values = {}
+
+        for section in config.sections():
+            for attribute, raw_value in config[section].items():
+                if raw_value and attribute not in values:
+                    values[attribute] = raw_value
+
+        return values
+
+    def compile(self, values):
+        # Converts and validates all known attributes at once
+        data = {}
+        errors = []
+        futures = values.get("trade_future", "").lower() == "true"
+
+        for attribute, (kind, default) in SCHEMA.items():
+            raw_value = values.get(attribute)
+
+            if raw_value is None:
+                if default is MANDATORY or (default is FUTURES and futures):
+                    errors.append(
+                        "Attribute " + attribute + " is not set, but mandatory!"
+                    )
+                    default = None
+                elif default is FUTURES:
+                    default = None
+
+                data[attribute] = default
+                continue
+
+            try:
+                data[attribute] = self.convert(kind, raw_value)
+            except ValueError:
+                errors.append(
+                    "Attribute "
+                    + attribute
+                    + " has the invalid value '"
+                    + raw_value
+                    + "'"
+                )
+                data[attribute] = None
+
+        if data["deal_mode"] and data["deal_mode"] != "signal":
+            try:
+                if not isinstance(json.loads(data["deal_mode"]), list):
+                    raise ValueError(data["deal_mode"])
+            except ValueError:
+                errors.append(
+                    "Attribute deal_mode is no valid JSON list of strategies. Please check https://jsonformatter.curiousconcept.com/ for correct format"
+                )
+
+        for attribute in ("signal_workers", "signal_queue_size"):
+            if data[attribute] is not None and data[attribute] < 1:
+                errors.append("Attribute " + attribute + " has to be at least 1")
+
+        if data["log_format"] not in ("text", "json"):
+            errors.append("Attribute log_format has to be text or json")
+
+        if data["btc_pulse_fallback"] not in ("downtrend", "uptrend", "keep"):
+            errors.append(
+                "Attribute btc_pulse_fallback has to be downtrend, uptrend or keep"
+            )
+
+        if data["btc_pulse_rule"] not in ("any", "all", "majority"):
+            errors.append("Attribute btc_pulse_rule has to be any, all or majority")
+
+        if not data["btc_pulse_symbols"]:
+            errors.append("Attribute btc_pulse_symbols needs at least one symbol")
+
+        source = data["btc_pulse_source"]
+        if source not in ("yfinance", "binance"):
+            if not source.endswith((".csv", ".parquet")):
+                errors.append(
+                    "Attribute btc_pulse_source has to be yfinance, binance or a .csv/.parquet file"
+                )
+            elif len(data["btc_pulse_symbols"] or ()) > 1 and "{symbol}" not in source:
+                errors.append(
+                    "Attribute btc_pulse_source needs {symbol} in the filename for several btc_pulse_symbols"
+                )
+        elif (
+            source == "binance"
+            and data["btc_pulse"]
+            and importlib.util.find_spec("websockets") is None
+        ):
+            errors.append(
+                "Attribute btc_pulse_source binance needs the websockets package"
+            )
+
+        if data["single"] and not data["single_count"]:
+            errors.append("Attribute single_count is not set, but mandatory!")
+
+        return data, errors
+
+    def convert(self, kind, raw_value):
+        if kind == "auto":
+            data = self.check_type(raw_value)
+        elif kind is str:
+            data = raw_value
+        elif kind is int:
+            data = int(raw_value)
+        elif kind == "number":
+            data = self.check_type(raw_value)
+            if isinstance(data, bool) or not isinstance(data, (int, float)):
+                raise ValueError(raw_value)
+        elif kind is bool:
+            if raw_value.lower() not in ["true", "false"]:
+                raise ValueError(raw_value)
+            data = raw_value.lower() == "true"
+        elif kind is list:
+            # Entries may be quoted like a Python list: ['USDT_BTC', "USDT_ETH"]
+            data = tuple(
+                entry.strip().strip("'\"").strip()
+                for entry in raw_value.strip().strip("[]").split(",")
+                if entry.strip().strip("'\"").strip()
             )
 
         return data
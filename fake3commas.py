@@ -0,0 +1,398 @@
+import io
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+from collections import deque
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl, urlsplit
+
+from py3cw.config import API_METHODS, API_VERSION_V1
+from py3cw.request import Py3CW
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RetryError
+from urllib3.exceptions import MaxRetryError
+from urllib3.response import HTTPResponse
+
+
+class Fake3Commas:
+    """In-memory stand-in for the synchronous Py3CW client
+
+    Keeps bots and active deals of one account in memory and answers the requests
+    used by 3cqsbot in the (error, data) format of Py3CW. Every request is recorded
+    in calls. Bots with the "nonstop" strategy open a deal when they are enabled,
+    start_new_deal opens one as long as max_active_deals is not reached. Deals are
+    never closed.
+
+    Parameters:
+    account_name (str): Name of the only account
+    market_pairs (list): Pairs tradeable on the account (e.g. USDT_BTC)
+    blacklist (list): Pairs on the 3Commas blacklist
+    bots (list): Bots existing before the start
+
+    """
+
+    def __init__(self, account_name, market_pairs, blacklist=None, bots=None):
+        self.account = {
+            "id": 31337,
+            "name": account_name,
+            "market_code": "binance",
+        }
+        self.market_pairs = list(market_pairs)
+        self.blacklist = list(blacklist or [])
+        self.bots = {}
+        self.deals = []
+        self.calls = []
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1000)
+        self.clock = datetime(2022, 1, 1)
+
+        for bot in bots or []:
+            self.store(dict(bot))
+
+    def request(
+        self, entity, action="", action_id=None, additional_headers=None, payload=None
+    ):
+        with self.lock:
+            self.calls.append((entity, action))
+            handler = getattr(self, entity + "_" + (action or "list"), None)
+
+            if handler is None:
+                return self.error("Unknown endpoint " + entity + "/" + action)
+
+            return handler(action_id, payload or {})
+
+    def error(self, msg):
+        return {"error": True, "msg": msg, "status_code": 422}, None
+
+    def timestamp(self):
+        # Strictly increasing updated_at values
+        self.clock += timedelta(seconds=1)
+        return self.clock.isoformat() + ".000Z"
+
+    def store(self, bot):
+        if isinstance(bot.get("pairs"), str):
+            bot["pairs"] = [bot["pairs"]]
+
+        bot.setdefault("id", next(self.ids))
+        bot.setdefault("is_enabled", False)
+        bot.setdefault("active_deals_count", 0)
+        bot["updated_at"] = self.timestamp()
+        self.bots[bot["id"]] = bot
+
+        return dict(bot)
+
+    def bot(self, action_id):
+        return self.bots.get(int(action_id)) if action_id else None
+
+    def open_deal(self, bot, pair):
+        if bot["active_deals_count"] >= bot.get("max_active_deals", 1):
+            return False
+
+        bot["active_deals_count"] += 1
+        self.deals.append(
+            {
+                "id": next(self.ids),
+                "bot_id": bot["id"],
+                "bot_name": bot["name"],
+                "pair": pair,
+                "account_id": self.account["id"],
+            }
+        )
+
+        return True
+
+    def accounts_list(self, action_id, payload):
+        return {}, [dict(self.account)]
+
+    def accounts_market_pairs(self, action_id, payload):
+        return {}, list(self.market_pairs)
+
+    def bots_pairs_black_list(self, action_id, payload):
+        return {}, {"pairs": list(self.blacklist)}
+
+    def bots_list(self, action_id, payload):
+        bots = list(self.bots.values())
+
+        if payload.get("sort_by") == "updated_at":
+            bots.sort(
+                key=lambda bot: bot["updated_at"],
+                reverse=payload.get("sort_direction") == "desc",
+            )
+
+        offset = int(payload.get("offset", 0))
+        limit = int(payload.get("limit", 50))
+
+        return {}, [dict(bot) for bot in bots[offset : offset + limit]]
+
+    def bots_create_bot(self, action_id, payload):
+        for bot in self.bots.values():
+            if bot["name"] == payload.get("name"):
+                return self.error("Name has already been taken")
+
+        bot = dict(payload)
+        bot.pop("id", None)
+
+        return {}, self.store(bot)
+
+    def bots_update(self, action_id, payload):
+        bot = self.bot(action_id)
+
+        if not bot:
+            return self.error("Bot " + str(action_id) + " not found")
+
+        bot.update(payload)
+
+        return {}, self.store(bot)
+
+    def bots_enable(self, action_id, payload):
+        bot = self.bot(action_id)
+
+        if not bot:
+            return self.error("Bot " + str(action_id) + " not found")
+
+        bot["is_enabled"] = True
+
+        if {"strategy": "nonstop"} in bot.get("strategy_list", []):
+            self.open_deal(bot, bot["pairs"][0])
+
+        return {}, self.store(bot)
+
+    def bots_disable(self, action_id, payload):
+        bot = self.bot(action_id)
+
+        if not bot:
+            return self.error("Bot " + str(action_id) + " not found")
+
+        bot["is_enabled"] = False
+
+        return {}, self.store(bot)
+
+    def bots_delete(self, action_id, payload):
+        bot = self.bots.pop(int(action_id), None)
+
+        if not bot:
+            return self.error("Bot " + str(action_id) + " not found")
+
+        return {}, {"id": bot["id"]}
+
+    def bots_start_new_deal(self, action_id, payload):
+        bot = self.bot(action_id)
+
+        if not bot:
+            return self.error("Bot " + str(action_id) + " not found")
+        if not bot["is_enabled"]:
+            return self.error("Bot is disabled")
+        if payload.get("pair") not in bot["pairs"]:
+            return self.error("Pair " + str(payload.get("pair")) + " not in bot")
+        if not self.open_deal(bot, payload["pair"]):
+            return self.error("Max active deals reached")
+
+        self.store(bot)
+
+        return {}, dict(self.deals[-1])
+
+    def deals_list(self, action_id, payload):
+        return {}, [dict(deal) for deal in self.deals]
+
+
+class FakeTransport(HTTPAdapter):
+    """Transport adapter answering Py3CW requests from a Fake3Commas account
+
+    Mounted on the requests session of Py3CW, so the real client code (signing,
+    JSON handling, urllib3 retries with backoff) runs against the fake account.
+    Every attempt can be delayed and answered with an injected error.
+
+    Parameters:
+    api (Fake3Commas): Account answering the requests
+    latency (float): Seconds every attempt takes
+    jitter (float): Additional random seconds up to this value
+    rate_limit (int): Requests per second before answering with 429, 0 = off
+    error_rate (float): Share of attempts answered with a 5xx error (0 - 1)
+    seed: Seed for jitter and errors, to reproduce a run
+    max_retries (Retry): Retry configuration of the replaced adapter
+
+    """
+
+    def __init__(
+        self,
+        api,
+        latency=0.0,
+        jitter=0.0,
+        rate_limit=0,
+        error_rate=0.0,
+        seed=None,
+        max_retries=0,
+    ):
+        super().__init__(max_retries=max_retries)
+        self.api = api
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.window = deque()
+        self.stats = {"attempts": 0, "retries": 0, "429": 0, "5xx": 0, "failed": 0}
+        self.routes = []
+
+        # Literal paths first, so that market_pairs does not match {id}
+        for entity in ("accounts", "bots", "deals"):
+            for action, (method, path) in API_METHODS[entity].items():
+                pattern = re.escape(path).replace(re.escape("{id}"), "(?P<id>[^/]+)")
+                if path:
+                    pattern = "/" + pattern
+
+                self.routes.append(
+                    (
+                        "{id}" in path,
+                        method,
+                        re.compile(re.escape(entity) + pattern),
+                        entity,
+                        action,
+                    )
+                )
+
+        self.routes.sort(key=lambda route: route[0])
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def limited(self):
+        # Sliding window of one second over all attempts
+        if not self.rate_limit:
+            return False
+
+        with self.lock:
+            now = time.monotonic()
+
+            while self.window and self.window[0] <= now - 1:
+                self.window.popleft()
+
+            if len(self.window) >= self.rate_limit:
+                return True
+
+            self.window.append(now)
+
+        return False
+
+    def response(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        headers = dict(headers or {})
+        headers["Content-Type"] = "application/json"
+
+        return HTTPResponse(
+            body=io.BytesIO(data),
+            headers=headers,
+            status=status,
+            preload_content=False,
+        )
+
+    def answer(self, request):
+        self.count("attempts")
+
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+            status = self.random.choice([500, 502, 503, 504])
+
+        if delay > 0:
+            time.sleep(delay)
+
+        if self.limited():
+            self.count("429")
+            return self.response(
+                429,
+                {"error": "rate_limit", "error_description": "Too many requests"},
+                {"Retry-After": "1"},
+            )
+
+        if failed:
+            self.count("5xx")
+            return self.response(
+                status,
+                {
+                    "error": "server_error",
+                    "error_description": "Injected " + str(status),
+                },
+            )
+
+        url = urlsplit(request.url)
+        path = url.path[len(API_VERSION_V1) :]
+
+        for with_id, method, pattern, entity, action in self.routes:
+            match = pattern.fullmatch(path)
+
+            if match and method == request.method:
+                break
+        else:
+            return self.response(404, {"error": "not_found"})
+
+        if request.body:
+            payload = json.loads(request.body)
+        else:
+            payload = dict(parse_qsl(url.query))
+
+        error, data = self.api.request(
+            entity=entity,
+            action=action,
+            action_id=match.groupdict().get("id"),
+            payload=payload,
+        )
+
+        if error:
+            return self.response(
+                error["status_code"],
+                {"error": "record_invalid", "error_description": error["msg"]},
+            )
+
+        return self.response(200, data)
+
+    def send(self, request, **kwargs):
+        retries = self.max_retries
+
+        while True:
+            response = self.answer(request)
+
+            has_retry_after = "Retry-After" in response.headers
+            if not retries.is_retry(request.method, response.status, has_retry_after):
+                if response.status >= 400:
+                    self.count("failed")
+
+                return self.build_response(request, response)
+
+            try:
+                retries = retries.increment(
+                    request.method, request.url, response=response
+                )
+            except MaxRetryError as error:
+                self.count("failed")
+                raise RetryError(error, request=request)
+
+            self.count("retries")
+            retries.sleep(response)
+
+
+def client(api, request_options=None, **faults):
+    """Creates a Py3CW client talking to a Fake3Commas account
+
+    Parameters:
+    api (Fake3Commas): Account answering the requests
+    request_options (dict): request_options of Py3CW (timeout, retries, backoff)
+    faults: Latency and error injection, see FakeTransport
+
+    Returns:
+    Py3CW: Client with the FakeTransport mounted
+
+    """
+
+    p3cw = Py3CW(key="fake", secret="fake", request_options=request_options)
+    retries = p3cw.session.get_adapter("https://").max_retries
+    p3cw.transport = FakeTransport(api, max_retries=retries, **faults)
+    p3cw.session.mount("https://", p3cw.transport)
+
+    return p3cw
@@ -0,0 +1,168 @@
+import json
+import math
+import random
+import threading
+
+from pycoingecko import CoinGeckoAPI
+
+# Well known symbols at the top of the synthetic market, the rest is generated
+SYMBOLS = [
+    "btc", "eth", "usdt", "bnb", "usdc", "xrp", "ada", "sol", "doge", "dot",
+    "matic", "shib", "trx", "avax", "dai", "uni", "wbtc", "ltc", "link", "atom",
+    "etc", "xlm", "xmr", "bch", "algo", "near", "vet", "fil", "icp", "ape",
+    "hbar", "flow", "mana", "sand", "egld", "xtz", "aave", "theta", "axs", "eos",
+    "chz", "zec", "mkr", "neo", "grt", "klay", "ftm", "snx", "rune", "crv",
+]  # fmt: skip
+
+# Quote markets with tickers on the synthetic exchange
+TARGETS = ["BTC", "BUSD", "USDT"]
+
+
+def synthetic_markets(count=3500, seed=42):
+    """Builds a deterministic market snapshot in the format of /coins/markets
+
+    Parameters:
+    count (int): Number of coins
+    seed (int): Seed for the generated symbols and values
+
+    Returns:
+    list: Coins ordered by market cap rank
+
+    """
+
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    markets = []
+
+    for rank in range(1, count + 1):
+        if rank <= len(SYMBOLS):
+            symbol = SYMBOLS[rank - 1]
+        else:
+            symbol = "".join(rng.choice(letters) for i in range(rng.randint(3, 5)))
+
+        price = round(30000 / rank ** rng.uniform(1.0, 1.6), 8)
+        supply = round(rng.uniform(1e6, 1e10))
+
+        markets.append(
+            {
+                "id": symbol + "-" + str(rank),
+                "symbol": symbol,
+                "name": symbol.upper(),
+                "image": "",
+                "current_price": price,
+                "market_cap": round(price * supply),
+                "market_cap_rank": rank,
+                "total_volume": round(price * supply * rng.uniform(0.001, 0.2)),
+                "high_24h": round(price * 1.05, 8),
+                "low_24h": round(price * 0.95, 8),
+                "price_change_percentage_24h": round(rng.uniform(-10, 10), 2),
+                "circulating_supply": supply,
+                "total_supply": supply,
+                "max_supply": None,
+                "last_updated": "2022-05-01T00:00:00.000Z",
+            }
+        )
+
+    return markets
+
+
+def synthetic_tickers(coin, seed=42):
+    # Tickers of one coin on the exchange in the format of /exchanges/{id}/tickers
+    rng = random.Random(coin["id"] + str(seed))
+    btc_price = 30000.0
+    tickers = []
+
+    for target in TARGETS:
+        if target == coin["symbol"].upper():
+            continue
+
+        volume_btc = coin["total_volume"] / btc_price * rng.uniform(0.01, 0.5)
+        tickers.append(
+            {
+                "base": coin["symbol"].upper(),
+                "target": target,
+                "coin_id": coin["id"],
+                "converted_volume": {
+                    "btc": volume_btc,
+                    "eth": volume_btc * 14,
+                    "usd": volume_btc * btc_price,
+                },
+            }
+        )
+
+    return tickers
+
+
+def record(filename, rank=3500):
+    """Stores the current CoinGecko market snapshot as JSON
+
+    Parameters:
+    filename (str): Target file
+    rank (int): Number of coins by market cap
+
+    """
+
+    cg = CoinGeckoAPI()
+    market = []
+
+    for page in range(1, math.ceil(rank / 250) + 1):
+        market += cg.get_coins_markets(vs_currency="usd", page=page, per_page=250)
+
+    with open(filename, "w") as file:
+        json.dump(market, file)
+
+    return market
+
+
+def load(filename):
+    with open(filename) as file:
+        return json.load(file)
+
+
+class FakeCoinGeckoAPI:
+    """Offline stand-in for pycoingecko.CoinGeckoAPI
+
+    Serves /coins/markets from a recorded or synthetic snapshot and generates
+    exchange tickers for it. All instances share the snapshot and the call counter,
+    so it can replace the class wherever CoinGeckoAPI() is instantiated.
+
+    """
+
+    markets = []
+    coins = {}
+    calls = {}
+    lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    @classmethod
+    def use(cls, markets):
+        # Sets the snapshot served by all instances and resets the call counter
+        cls.markets = markets
+        cls.coins = {coin["id"]: coin for coin in markets}
+        cls.calls = {}
+
+    @classmethod
+    def count(cls, name):
+        with cls.lock:
+            cls.calls[name] = cls.calls.get(name, 0) + 1
+
+    def get_coins_markets(self, vs_currency, page=1, per_page=100, **kwargs):
+        self.count("coins_markets")
+        start = (int(page) - 1) * int(per_page)
+
+        return self.markets[start : start + int(per_page)]
+
+    def get_exchanges_tickers_by_id(self, id, coin_ids=None, page=1, **kwargs):
+        # 100 tickers per page like CoinGecko
+        self.count("exchanges_tickers")
+        tickers = []
+
+        for coin_id in str(coin_ids or "").split(","):
+            if coin_id in self.coins:
+                tickers += synthetic_tickers(self.coins[coin_id])
+
+        start = (int(page) - 1) * 100
+
+        return {"name": id, "tickers": tickers[start : start + 100]}
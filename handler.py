@@ -0,0 +1,255 @@
+import functools
+import json
+import sys
+
+import logqueue
+import tgparser
+
+from multibot import MultiBot
+from singlebot import SingleBot
+from tgparser import Signal
+
+
+class SignalHandler:
+    """Turns 3CQS Telegram messages into bot actions
+
+    Used by 3cqsbot.py for live messages and by replay.py for recorded ones.
+
+    Parameters:
+    attributes (Config): Bot configuration
+    p3cw (AsyncPy3CW): Awaitable 3Commas client
+    bots (BotInventory): 3Commas bot inventory
+    signalqueue (SignalQueue): Queue processing the signals
+    state: Shared state with btcbool, accountData and pairData
+    logging: Logging facility
+
+    """
+
+    def __init__(self, attributes, p3cw, bots, signalqueue, state, logging):
+        self.attributes = attributes
+        self.p3cw = p3cw
+        self.bots = bots
+        self.signalqueue = signalqueue
+        self.state = state
+        self.logging = logging
+        # signal_log file name with its background writer
+        self.recorder = None
+
+    async def account_data(self):
+        # Gets information about the used 3commas account (paper or real)
+        settings = self.attributes.settings
+        account = {}
+
+        error, data = await self.p3cw.request(
+            entity="accounts",
+            action="",
+            additional_headers={"Forced-Mode": settings.trade_mode},
+        )
+
+        if error:
+            self.logging.debug(error["msg"])
+            sys.tracebacklimit = 0
+            sys.exit("Problem fetching account data from 3commas api - stopping!")
+        else:
+            for accounts in data:
+                if accounts["name"] == settings.account_name:
+                    account.update({"id": str(accounts["id"])})
+                    account.update({"market_code": str(accounts["market_code"])})
+
+            if "id" not in account:
+                sys.tracebacklimit = 0
+                sys.exit("Account with name '" + settings.account_name + "' not found")
+
+        return account
+
+    async def pair_data(self, account):
+        settings = self.attributes.settings
+        pairs = []
+
+        error, data = await self.p3cw.request(
+            entity="accounts",
+            action="market_pairs",
+            additional_headers={"Forced-Mode": settings.trade_mode},
+            payload={"market_code": account["market_code"]},
+        )
+
+        if error:
+            self.logging.debug(error["msg"])
+            sys.tracebacklimit = 0
+            sys.exit("Problem fetching pair data from 3commas api - stopping!")
+
+        error, blacklist_data = await self.p3cw.request(
+            entity="bots", action="pairs_black_list"
+        )
+
+        if error:
+            self.logging.debug(error["msg"])
+            sys.tracebacklimit = 0
+            sys.exit(
+                "Problem fetching pairs blacklist data from 3commas api - stopping!"
+            )
+
+        for pair in data:
+            if settings.market in pair:
+                if (
+                    pair not in settings.token_denylist
+                    and pair not in blacklist_data["pairs"]
+                ):
+                    pairs.append(pair)
+
+        return pairs
+
+    async def load(self):
+        # Account, pairs and bots needed before the first signal
+        self.state.accountData = await self.account_data()
+        self.state.pairData = await self.pair_data(self.state.accountData)
+        await self.bots.load()
+
+    def signal_key(self, tg_output):
+        # Signals with the same key are processed in order, others in parallel
+        settings = self.attributes.settings
+
+        if settings.single and not isinstance(tg_output, list):
+            return tg_output.pair
+
+        # All multibot signals change the pair list of the same bot
+        return settings.prefix + "_" + settings.subprefix + "_" + settings.suffix
+
+    def job(self, tg_output):
+        # Work item for the signal queue
+        return functools.partial(self.process_signal, tg_output)
+
+    async def process_signal(self, tg_output):
+        settings = self.attributes.settings
+        bot_output = self.bots
+        account_output = self.state.accountData
+        pair_output = self.state.pairData
+
+        if tg_output and not isinstance(tg_output, list):
+
+            self.logging.info("New 3CQS signal '%s' incoming...", tg_output.signal)
+
+            # Check if it is the right signal
+            if (
+                tg_output.signal == settings.symrank_signal
+                or settings.symrank_signal == "all"
+            ):
+
+                # Choose multibot or singlebot
+                if settings.single:
+                    bot = SingleBot(
+                        tg_output,
+                        bot_output,
+                        account_output,
+                        self.attributes,
+                        self.p3cw,
+                        self.logging,
+                    )
+                else:
+                    bot = MultiBot(
+                        tg_output,
+                        bot_output,
+                        account_output,
+                        pair_output,
+                        self.attributes,
+                        self.p3cw,
+                        self.logging,
+                    )
+                    # Every signal triggers a new multibot deal
+                    await bot.trigger(triggeronly=True)
+
+                # Trigger bot if limits passed
+                if tg_output.volatility != 0 and tg_output.pair in pair_output:
+                    if (
+                        tg_output.volatility >= settings.volatility_limit_min
+                        and tg_output.volatility <= settings.volatility_limit_max
+                        and tg_output.price_action >= settings.price_action_limit_min
+                        and tg_output.price_action <= settings.price_action_limit_max
+                        and tg_output.symrank >= settings.symrank_limit_min
+                        and tg_output.symrank <= settings.symrank_limit_max
+                    ) or tg_output.action == "STOP":
+
+                        await bot.trigger()
+
+                    else:
+                        self.logging.info(
+                            "Start signal for %s with symrank: %s, volatility: %s "
+                            "and price action: %s not meeting config filter limits "
+                            "- signal ignored",
+                            tg_output.pair,
+                            tg_output.symrank,
+                            tg_output.volatility,
+                            tg_output.price_action,
+                        )
+                else:
+                    self.logging.info(
+                        "%s is not traded on '%s'",
+                        tg_output.pair,
+                        settings.account_name,
+                    )
+            else:
+                self.logging.info(
+                    "Signal ignored because '%s' is configured", settings.symrank_signal
+                )
+
+        elif tg_output and isinstance(tg_output, list):
+            if not settings.single:
+                # Create or update multibot with pairs from "/symrank"
+                bot = MultiBot(
+                    tg_output,
+                    bot_output,
+                    account_output,
+                    pair_output,
+                    self.attributes,
+                    self.p3cw,
+                    self.logging,
+                )
+                await bot.create()
+            else:
+                self.logging.debug(
+                    "Ignoring /symrank call, because we're running in single mode!"
+                )
+
+    def record(self, raw_text, date):
+        # Appends the message to signal_log for replay.py. The file stays open and
+        # is written in a background thread, it is reopened if signal_log changes
+        filename = self.attributes.settings.signal_log
+
+        if self.recorder is None or self.recorder[0] != filename:
+            if self.recorder:
+                logqueue.close(self.recorder[2])
+                self.recorder = None
+
+            self.recorder = (filename,) + logqueue.writer("signal_log", filename)
+
+        self.recorder[1].info(
+            "%s", json.dumps({"date": date.isoformat(), "text": raw_text})
+        )
+
+    async def handle(self, raw_text, date=None):
+        # Parses a Telegram message and queues it for processing
+        settings = self.attributes.settings
+
+        if settings.signal_log and date:
+            try:
+                self.record(raw_text, date)
+            except OSError as error:
+                self.logging.error("Cannot write signal_log: %s", error)
+
+        if self.state.btcbool and settings.btc_pulse and not settings.ext_botswitch:
+            self.logging.info(
+                "New 3CQS signal not processed - 3cqsbot stopped because of BTC downtrend"
+            )
+            return None
+
+        tg_output = tgparser.parse(raw_text, settings.market)
+        self.logging.debug("TG msg: %s", tg_output)
+
+        if isinstance(tg_output, Signal) and not tg_output.signal:
+            self.logging.warning(
+                "Unknown 3CQS signal '%s' ignored - please report it", tg_output.title
+            )
+        elif tg_output:
+            await self.signalqueue.put(self.signal_key(tg_output), self.job(tg_output))
+
+        return tg_output
@@ -0,0 +1,154 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+
+from datetime import datetime
+
+# Attributes of every LogRecord, everything else was passed with extra
+RECORD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class Lazy:
+    """Log argument calling func only when the message is rendered
+
+    logging.info("Volume %s", Lazy(format_currency, volume, "USD")) skips the
+    formatting, if INFO is disabled.
+
+    """
+
+    __slots__ = ("func", "args", "kwargs")
+
+    def __init__(self, func, *args, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return str(self.func(*self.args, **self.kwargs))
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line for machine consumption
+
+    Contains time, level, logger and the rendered message. Fields passed with
+    extra (e.g. logging.info("...", extra={"pair": pair})) are added as they are.
+
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+
+        for name, value in vars(record).items():
+            if name not in RECORD:
+                entry[name] = value
+
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+class LogQueueHandler(logging.handlers.QueueHandler):
+    # Renders only the message in the logging thread - its arguments (e.g. pair
+    # lists) may change afterwards. Formatting and writing is left to the writer
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+
+        return record
+
+
+def setup(level, handler, log_format="text"):
+    """Sends all log records through a queue to a background writer thread
+
+    Records below level are dropped before their message is rendered. Formatting
+    and writing happen in the thread of the QueueListener, so a slow log file
+    does not block the event loop.
+
+    Parameters:
+    level: Log level of the root logger
+    handler (logging.Handler): Handler writing the records
+    log_format (str): "text" or "json" (one JSON object per line)
+
+    Returns:
+    QueueListener: Running writer thread, stopped at exit
+
+    """
+
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(
+            logging.Formatter(
+                "%(asctime)s %(levelname)-8s %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+            )
+        )
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        records, handler, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    for previous in root.handlers[:]:
+        root.removeHandler(previous)
+
+    root.addHandler(LogQueueHandler(records))
+    root.setLevel(level)
+
+    return listener
+
+
+def writer(name, filename):
+    """Logger appending its messages as lines to filename in a background thread
+
+    The file stays open and is written by a QueueListener, so the event loop
+    only puts the record into a queue. The messages are written as they are,
+    independent of the log level of the root logger.
+
+    Parameters:
+    name (str): Name of the logger
+    filename (str): File the lines are appended to
+
+    Returns:
+    tuple: Logger and its running QueueListener, stopped at exit
+
+    """
+
+    handler = logging.FileHandler(filename, mode="a", encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger = logging.getLogger(name)
+    for previous in logger.handlers[:]:
+        logger.removeHandler(previous)
+
+    logger.addHandler(LogQueueHandler(records))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+    return logger, listener
+
+
+def close(listener):
+    # Writes the waiting records and closes the file of a writer
+    atexit.unregister(listener.stop)
+    listener.stop()
+
+    for handler in listener.handlers:
+        handler.close()
@@ -0,0 +1,343 @@
+import abc
+import asyncio
+import json
+import random
+import time
+
+from datetime import datetime, timezone
+
+import pandas as pd
+import requests
+import yfinance as yf
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+
+class Provider(abc.ABC):
+    """Source of the candles of the btc-pulse
+
+    load() adds the newest candles of all coins to their CandleBuffers with one
+    shared download (or stream), wait() returns when the next candle should be
+    available. Polling providers simply sleep for one candle interval.
+
+    Parameters:
+    coins (tuple): Coins of the pulse (e.g. BTC, ETH)
+
+    """
+
+    interval = 300
+
+    def __init__(self, coins=("BTC",)):
+        self.coins = tuple(coins)
+
+    def symbol(self, coin):
+        # Symbol of the coin in the notation of the provider
+        return coin
+
+    @abc.abstractmethod
+    async def load(self, buffers):
+        # Returns the number of new or updated candles of all coins
+        pass
+
+    async def wait(self):
+        await asyncio.sleep(self.interval)
+
+    def now(self):
+        # Current time (seconds) to check the age of the last candle
+        return time.time()
+
+
+class YFinanceProvider(Provider):
+    """5 minute candles downloaded from Yahoo Finance every 5 minutes
+
+    All coins are downloaded in one request. The first load downloads 6 hours,
+    afterwards only the candles since the oldest last candle of the coins. The
+    blocking download runs in the default executor.
+
+    Parameters:
+    coins (tuple): Coins of the pulse
+    currency (str): Quote currency of the charts
+
+    """
+
+    def __init__(self, coins=("BTC",), currency="USD"):
+        super().__init__(coins)
+        self.currency = currency
+
+    def symbol(self, coin):
+        return coin + "-" + self.currency
+
+    def download(self, start=None):
+        # Blocking yfinance download of 5 minute candles, 6 hours or since start
+        tickers = " ".join(self.symbol(coin) for coin in self.coins)
+
+        if start is None:
+            chart = yf.download(
+                tickers=tickers, period="6h", interval="5m", progress=False
+            )
+        else:
+            chart = yf.download(
+                tickers=tickers, start=start, interval="5m", progress=False
+            )
+
+        if len(chart) == 0:
+            raise IOError("Downloading YFinance chart broken, retry....")
+
+        return chart
+
+    async def load(self, buffers):
+        start = None
+        last = [buffers[coin].last for coin in self.coins]
+        if None not in last:
+            start = datetime.fromtimestamp(min(last), tz=timezone.utc)
+
+        loop = asyncio.get_running_loop()
+        chart = await loop.run_in_executor(None, self.download, start)
+
+        return sum(
+            buffers[coin].update(chart, self.symbol(coin)) for coin in self.coins
+        )
+
+
+class BinanceProvider(Provider):
+    """5 minute klines streamed by the Binance websocket API
+
+    History is loaded once over REST, afterwards one combined kline stream for
+    all coins updates the open candles continuously and wait() returns within a
+    second of a candle close instead of polling. Lost connections are reopened
+    with exponential backoff and the gaps are filled over REST. Needs the
+    websockets package.
+
+    Parameters:
+    coins (tuple): Coins of the pulse, traded against USDT
+    logging: Logger for connection problems
+
+    """
+
+    REST = "https://api.binance.com/api/v3/klines"
+    STREAM = "wss://stream.binance.com:9443/stream?streams="
+
+    def __init__(self, coins=("BTC",), logging=None):
+        if websockets is None:
+            raise ImportError("The binance btc-pulse source needs websockets")
+
+        super().__init__(coins)
+        self.logging = logging
+        self.buffers = None
+        self.task = None
+        self.closed = None
+        self.closes = {}
+
+    def symbol(self, coin):
+        return coin + "USDT"
+
+    def klines(self, symbol, start=None, limit=1000):
+        # Blocking REST request of the last (or since start) 5 minute klines
+        params = {"symbol": symbol, "interval": "5m", "limit": limit}
+        if start is not None:
+            params["startTime"] = start * 1000
+
+        response = requests.get(self.REST, params=params, timeout=10)
+        response.raise_for_status()
+
+        return [(kline[0] // 1000, float(kline[4])) for kline in response.json()]
+
+    async def history(self):
+        # Fills the buffers or the gaps since their last candle
+        loop = asyncio.get_running_loop()
+        added = 0
+
+        for coin in self.coins:
+            candles = self.buffers[coin]
+            limit = candles.size if candles.last is None else 1000
+            klines = await loop.run_in_executor(
+                None, self.klines, self.symbol(coin), candles.last, limit
+            )
+            added += sum(candles.append(*kline) for kline in klines)
+
+        return added
+
+    async def load(self, buffers):
+        if self.task is None or self.task.done():
+            self.buffers = buffers
+            self.closed = asyncio.Event()
+            added = await self.history()
+            self.task = asyncio.get_running_loop().create_task(self.stream())
+        else:
+            added = 0
+
+        self.closed.clear()
+
+        return added
+
+    def handle(self, message):
+        data = json.loads(message)["data"]
+        kline = data["k"]
+        coin = data["s"][: -len("USDT")]
+
+        self.buffers[coin].append(kline["t"] // 1000, float(kline["c"]))
+
+        # The candle is complete when it was closed for all coins
+        if kline["x"]:
+            self.closes[coin] = kline["t"]
+            if len(set(self.closes.get(coin) for coin in self.coins)) == 1:
+                self.closed.set()
+
+    async def stream(self):
+        url = self.STREAM + "/".join(
+            self.symbol(coin).lower() + "@kline_5m" for coin in self.coins
+        )
+        retries = 0
+
+        while True:
+            try:
+                async with websockets.connect(url) as socket:
+                    if retries:
+                        await self.history()
+                    retries = 0
+
+                    async for message in socket:
+                        self.handle(message)
+            except Exception as error:  # pylint: disable=broad-except
+                retries += 1
+                delay = random.uniform(0, min(60, 2**retries))
+
+                if self.logging:
+                    self.logging.warning(
+                        "Binance kline stream lost (%s), reconnecting in %.1fs",
+                        error,
+                        delay,
+                    )
+
+                await asyncio.sleep(delay)
+
+    async def wait(self):
+        # Next candle close, the btc-pulse checks outdated data after a timeout
+        try:
+            await asyncio.wait_for(self.closed.wait(), self.interval + 60)
+        except asyncio.TimeoutError:
+            pass
+
+        self.closed.clear()
+
+
+class FileProvider(Provider):
+    """Replays candles of CSV or Parquet files
+
+    A file needs a time column (time, timestamp, date or datetime as date or
+    epoch seconds/milliseconds) or a DatetimeIndex and a close column. With
+    several coins the filename contains {symbol}, e.g. charts/{symbol}.csv. The
+    first load seeds the buffers, every following load adds one candle per
+    coin. Reading Parquet needs pyarrow or fastparquet.
+
+    Parameters:
+    filename (str): CSV or Parquet file
+    coins (tuple): Coins of the pulse
+    speed (float): Candle intervals per second, 0 = as fast as possible
+
+    """
+
+    def __init__(self, filename, coins=("BTC",), speed=0):
+        if len(coins) > 1 and "{symbol}" not in filename:
+            raise ValueError(filename + " needs {symbol} for several coins")
+
+        super().__init__(coins)
+        self.filename = filename
+        self.speed = speed
+        self.charts = None
+        self.position = 0
+
+    def symbol(self, coin):
+        return self.filename.replace("{symbol}", coin)
+
+    def read(self, filename):
+        # (times, closes) of a file
+        if filename.endswith(".parquet"):
+            chart = pd.read_parquet(filename)
+        else:
+            chart = pd.read_csv(filename)
+
+        columns = {column.lower(): column for column in chart.columns}
+
+        for name in ("time", "timestamp", "date", "datetime"):
+            if name in columns:
+                times = chart[columns[name]]
+                break
+        else:
+            times = chart.index.to_series()
+
+        if pd.api.types.is_numeric_dtype(times):
+            # Epoch seconds or milliseconds
+            times = times.astype("int64")
+            if len(times) and times.iloc[0] > 1e11:
+                times = times // 1000
+            times = times.tolist()
+        else:
+            times = [
+                int(moment.timestamp()) for moment in pd.to_datetime(times, utc=True)
+            ]
+
+        return times, chart[columns["close"]].astype(float).tolist()
+
+    def length(self):
+        return min(len(self.charts[coin][0]) for coin in self.coins)
+
+    async def load(self, buffers):
+        if self.charts is None:
+            self.charts = {coin: self.read(self.symbol(coin)) for coin in self.coins}
+            count = min(max(buffers[coin].size for coin in self.coins), self.length())
+        else:
+            count = min(1, self.length() - self.position)
+
+        end = self.position + count
+        for coin in self.coins:
+            times, closes = self.charts[coin]
+
+            for timestamp, close in zip(
+                times[self.position : end], closes[self.position : end]
+            ):
+                buffers[coin].append(timestamp, close)
+
+        self.position = end
+
+        return count * len(self.coins)
+
+    async def wait(self):
+        if self.charts is not None and self.position >= self.length():
+            raise EOFError("End of " + self.filename)
+
+        await asyncio.sleep(self.interval / self.speed if self.speed else 0)
+
+    def now(self):
+        # Time of the replayed candles, so the data is never outdated
+        if not self.position:
+            return time.time()
+
+        return (
+            max(self.charts[coin][0][self.position - 1] for coin in self.coins)
+            + self.interval
+        )
+
+
+def provider(source, coins=("BTC",), logging=None):
+    """Creates the btc-pulse provider of btc_pulse_source
+
+    Parameters:
+    source (str): yfinance, binance or a CSV/Parquet file
+    coins (tuple): Coins of the pulse (btc_pulse_symbols)
+    logging: Logger of the provider
+
+    Returns:
+    Provider: Candle source of the btc-pulse
+
+    """
+
+    if source == "yfinance":
+        return YFinanceProvider(coins)
+    if source == "binance":
+        return BinanceProvider(coins, logging=logging)
+
+    return FileProvider(source, coins)
@@ -1,9 +1,17 @@
 import random
 import json
+import weakref
+import asyncio
 from sys import prefix
 
 from signals import Signals
 
+# Pair changes per multibot id, waiting to be sent to 3Commas in one update
+pending_updates = {}
+
+# Static payload parts per settings snapshot
+templates = weakref.WeakKeyDictionary()
+
 
 class MultiBot:
     def __init__(
@@ -14,218 +22,219 @@ class MultiBot:
         self.account_data = account_data
         self.pair_data = pair_data
         self.attributes = attributes
+        self.settings = attributes.settings
         self.p3cw = p3cw
         self.logging = logging
         self.signal = Signals(logging)
-        self.prefix = self.attributes.get("prefix")
-        self.subprefix = self.attributes.get("subprefix")
-        self.suffix = self.attributes.get("suffix")
+        self.prefix = self.settings.prefix
+        self.subprefix = self.settings.subprefix
+        self.suffix = self.settings.suffix
 
     def strategy(self):
-        if self.attributes.get("deal_mode", "signal") == "signal":
+        # deal_mode has already been validated while reading config.ini
+        if self.settings.deal_mode == "signal":
             strategy = [{"strategy": "manual"}]
         else:
-            try:
-                strategy = json.loads(self.attributes.get("deal_mode"))
-            except ValueError:
-                self.logging.error(
-                    "Decoding JSON string of deal_mode failed. Please check https://jsonformatter.curiousconcept.com/ for correct format"
-                )
+            strategy = json.loads(self.settings.deal_mode)
 
         return strategy
 
     def adjustmad(self, pairs, mad):
         # Lower max active deals, when pairs are under mad
-        if len(pairs) * self.attributes.get("sdsp") < mad:
+        if len(pairs) * self.settings.sdsp < mad:
             self.logging.debug(
                 "Pairs are under 'mad' - Lower max active deals to actual pairs"
             )
             mad = len(pairs)
         # Raise max active deals to minimum pairs or mad if possible
-        elif len(pairs) * self.attributes.get("sdsp") >= mad:
+        elif len(pairs) * self.settings.sdsp >= mad:
             self.logging.debug("Pairs are over 'mad' - nothing to do")
-            mad = self.attributes.get("mad")
+            mad = self.settings.mad
 
         return mad
 
-    def payload(self, pairs, mad, new_bot):
+    def template(self):
+        # Static part of the payload, built once per settings snapshot
+        template = templates.get(self.settings)
+
+        if template is None:
+            template = {
+                "name": self.prefix + "_" + self.subprefix + "_" + self.suffix,
+                "base_order_volume": self.settings.bo,
+                "take_profit": self.settings.tp,
+                "safety_order_volume": self.settings.so,
+                "martingale_volume_coefficient": self.settings.os,
+                "martingale_step_coefficient": self.settings.ss,
+                "max_safety_orders": self.settings.mstc,
+                "safety_order_step_percentage": self.settings.sos,
+                "take_profit_type": "total",
+                "active_safety_orders_count": self.settings.max,
+                "cooldown": self.settings.cooldown,
+                "strategy_list": self.strategy(),
+                "trailing_enabled": self.settings.trailing,
+                "trailing_deviation": self.settings.trailing_deviation,
+                "allowed_deals_on_same_pair": self.settings.sdsp,
+                "min_volume_btc_24h": self.settings.btc_min_vol,
+                "disable_after_deals_count": self.settings.deals_count,
+            }
+
+            if self.settings.trade_future:
+                template.update(
+                    {
+                        "leverage_type": self.settings.leverage_type,
+                        "leverage_custom_value": self.settings.leverage_value,
+                        "stop_loss_percentage": self.settings.stop_loss_percent,
+                        "stop_loss_type": self.settings.stop_loss_type,
+                        "stop_loss_timeout_enabled": self.settings.stop_loss_timeout_enabled,
+                        "stop_loss_timeout_in_seconds": self.settings.stop_loss_timeout_seconds,
+                    }
+                )
 
-        payload = {
-            "name": self.prefix + "_" + self.subprefix + "_" + self.suffix,
-            "account_id": self.account_data["id"],
-            "pairs": pairs,
-            "max_active_deals": mad,
-            "base_order_volume": self.attributes.get("bo"),
-            "take_profit": self.attributes.get("tp"),
-            "safety_order_volume": self.attributes.get("so"),
-            "martingale_volume_coefficient": self.attributes.get("os"),
-            "martingale_step_coefficient": self.attributes.get("ss"),
-            "max_safety_orders": self.attributes.get("mstc"),
-            "safety_order_step_percentage": self.attributes.get("sos"),
-            "take_profit_type": "total",
-            "active_safety_orders_count": self.attributes.get("max"),
-            "cooldown": self.attributes.get("cooldown", 0),
-            "strategy_list": self.strategy(),
-            "trailing_enabled": self.attributes.get("trailing", False),
-            "trailing_deviation": self.attributes.get("trailing_deviation", 0.2),
-            "allowed_deals_on_same_pair": self.attributes.get("sdsp"),
-            "min_volume_btc_24h": self.attributes.get("btc_min_vol", 0),
-            "disable_after_deals_count": self.attributes.get("deals_count", 0),
-        }
+            templates[self.settings] = template
+
+        return template
+
+    def payload(self, pairs, mad, new_bot):
+        payload = dict(self.template())
+        payload.update(
+            {
+                "account_id": self.account_data["id"],
+                "pairs": pairs,
+                "max_active_deals": mad,
+            }
+        )
 
         if new_bot:
             if payload["disable_after_deals_count"] == 0:
-                self.logging.info("This is a new bot and deal_count set to 0, removing from payload")
+                self.logging.info(
+                    "This is a new bot and deal_count set to 0, removing from payload"
+                )
                 payload.pop("disable_after_deals_count")
 
-        if self.attributes.get("trade_future", False):
-            payload.update(
-                {
-                    "leverage_type": self.attributes.get("leverage_type"),
-                    "leverage_custom_value": self.attributes.get("leverage_value"),
-                    "stop_loss_percentage": self.attributes.get("stop_loss_percent"),
-                    "stop_loss_type": self.attributes.get("stop_loss_type"),
-                    "stop_loss_timeout_enabled": self.attributes.get(
-                        "stop_loss_timeout_enabled"
-                    ),
-                    "stop_loss_timeout_in_seconds": self.attributes.get(
-                        "stop_loss_timeout_seconds"
-                    ),
-                }
-            )
-
         return payload
 
-    def enable(self, bot):
+    async def enable(self, bot):
         # Enables an existing bot
         if not bot["is_enabled"]:
-            self.logging.info("Enabling bot: " + bot["name"])
+            self.logging.info("Enabling bot: %s", bot["name"])
 
-            error, data = self.p3cw.request(
+            error, data = await self.p3cw.request(
                 entity="bots",
                 action="enable",
                 action_id=str(bot["id"]),
-                additional_headers={"Forced-Mode": self.attributes.get("trade_mode")},
+                additional_headers={"Forced-Mode": self.settings.trade_mode},
             )
 
             if error:
                 self.logging.error(error["msg"])
+            else:
+                self.bot_data.update(data)
 
         else:
-            self.logging.info(bot["name"] + " enabled")
+            self.logging.info("%s enabled", bot["name"])
 
-    def disable(self):
+    async def disable(self):
         # Disables an existing bot
-        for bot in self.bot_data:
-            if (self.prefix + "_" + self.subprefix + "_" + self.suffix) == bot["name"]:
+        bot = self.bot_data.get(self.prefix + "_" + self.subprefix + "_" + self.suffix)
 
-                # Disables an existing bot
-                self.logging.info("Disabling bot: " + bot["name"])
+        if bot:
+            self.logging.info("Disabling bot: %s", bot["name"])
 
-                error, data = self.p3cw.request(
-                    entity="bots",
-                    action="disable",
-                    action_id=str(bot["id"]),
-                    additional_headers={
-                        "Forced-Mode": self.attributes.get("trade_mode")
-                    },
-                )
+            error, data = await self.p3cw.request(
+                entity="bots",
+                action="disable",
+                action_id=str(bot["id"]),
+                additional_headers={"Forced-Mode": self.settings.trade_mode},
+            )
 
-                if error:
-                    self.logging.error(error["msg"])
+            if error:
+                self.logging.error(error["msg"])
+            else:
+                self.bot_data.update(data)
 
-    def new_deal(self, bot, triggerpair):
+    async def new_deal(self, bot, triggerpair):
         # Triggers a new deal
         if triggerpair:
             pair = triggerpair
         else:
-            if self.attributes.get("random_pair", "true"):
+            if self.settings.random_pair:
                 pair = random.choice(bot["pairs"])
             else:
                 pair = ""
 
         if pair:
-            self.logging.info("Trigger new deal with pair " + pair)
-            error, data = self.p3cw.request(
+            self.logging.info(
+                "Trigger new deal with pair %s", pair, extra={"pair": pair}
+            )
+            error, data = await self.p3cw.request(
                 entity="bots",
                 action="start_new_deal",
                 action_id=str(bot["id"]),
-                additional_headers={"Forced-Mode": self.attributes.get("trade_mode")},
+                additional_headers={"Forced-Mode": self.settings.trade_mode},
                 payload={"pair": pair},
             )
 
             if error:
                 if bot["active_deals_count"] == bot["max_active_deals"]:
                     self.logging.info(
-                        "Max active deals of "
-                        + str(bot["max_active_deals"])
-                        + " reached, not adding a new one."
+                        "Max active deals of %s reached, not adding a new one.",
+                        bot["max_active_deals"],
                     )
                 else:
                     self.logging.error(error["msg"])
 
-    def create(self):
+    async def create(self):
         # Creates a multi bot with start signal
-        new_bot = True
         pairs = []
-        botnames = []
-        mad = self.attributes.get("mad")
+        mad = self.settings.mad
 
         # Check for existing or new bot
-        for bot in self.bot_data:
-
-            botnames.append(bot["name"])
-
-            if (self.prefix + "_" + self.subprefix + "_" + self.suffix) == bot["name"]:
-                botid = str(bot["id"])
-                new_bot = False
-                break
-
-        self.logging.debug("Existing bot names: " + str(botnames))
+        bot = self.bot_data.get(self.prefix + "_" + self.subprefix + "_" + self.suffix)
+        new_bot = bot is None
 
         # Initial pairlist
         pairlist = self.tg_data
 
         # Filter topcoins (if set)
-        if self.attributes.get("topcoin_filter", False):
-            pairlist = self.signal.topcoin(
+        if self.settings.topcoin_filter:
+            pairlist = await self.signal.topcoin_async(
                 self.tg_data,
-                self.attributes.get("topcoin_limit", 3500),
-                self.attributes.get("topcoin_volume", 0),
-                self.attributes.get("topcoin_exchange", "binance"),
-                self.attributes.get("market"),
+                self.settings.topcoin_limit,
+                self.settings.topcoin_volume,
+                self.settings.topcoin_exchange,
+                self.settings.market,
             )
         else:
             self.logging.info("Topcoin filter disabled, not filtering pairs!")
 
         for pair in pairlist:
-            pair = self.attributes.get("market") + "_" + pair
+            pair = self.settings.market + "_" + pair
             # Traded on our exchange?
             if pair in self.pair_data:
-                self.logging.debug(pair + " added to the list")
+                self.logging.debug("%s added to the list", pair)
                 pairs.append(pair)
             else:
                 self.logging.info(
-                    pair
-                    + " removed because pair is blacklisted on 3commas or in config.ini or not tradable on '"
-                    + self.attributes.get("account_name")
-                    + "'"
+                    "%s removed because pair is blacklisted on 3commas or in "
+                    "config.ini or not tradable on '%s'",
+                    pair,
+                    self.settings.account_name,
                 )
 
-        self.logging.debug("Pairs after topcoin filter " + str(pairs))
+        self.logging.debug("Pairs after topcoin filter %s", pairs)
 
         # Run filters to adapt pair list
-        if self.attributes.get("limit_initial_pairs", False):
+        if self.settings.limit_initial_pairs:
             # Limit pairs to the maximal deals (mad)
-            if self.attributes.get("mad") == 1:
+            if self.settings.mad == 1:
                 maxpairs = 2
-            elif self.attributes.get("mad") <= len(pairs):
-                maxpairs = self.attributes.get("mad")
+            elif self.settings.mad <= len(pairs):
+                maxpairs = self.settings.mad
             else:
                 maxpairs = len(pairs)
             pairs = pairs[0:maxpairs]
 
-            self.logging.debug("Pairs after limit initial pairs filter " + str(pairs))
+            self.logging.debug("Pairs after limit initial pairs filter %s", pairs)
 
         # Adapt mad if pairs are under value
         mad = self.adjustmad(pairs, mad)
@@ -233,123 +242,220 @@ class MultiBot:
         if new_bot:
 
             self.logging.info(
-                "Creating multi bot "
-                + self.prefix
-                + "_"
-                + self.subprefix
-                + "_"
-                + self.suffix
-                + " with filtered symrank pairs"
+                "Creating multi bot %s_%s_%s with filtered symrank pairs",
+                self.prefix,
+                self.subprefix,
+                self.suffix,
             )
-            error, data = self.p3cw.request(
+            error, data = await self.p3cw.request(
                 entity="bots",
                 action="create_bot",
-                additional_headers={"Forced-Mode": self.attributes.get("trade_mode")},
+                additional_headers={"Forced-Mode": self.settings.trade_mode},
                 payload=self.payload(pairs, mad, new_bot),
             )
 
             if error:
                 self.logging.error(error["msg"])
             else:
-                if not self.attributes.get("ext_botswitch", False):
-                    self.enable(data)
+                self.bot_data.update(data)
+                if not self.settings.ext_botswitch:
+                    await self.enable(data)
                 else:
                     self.logging.info(
                         "ext_botswitch set to true, bot has to be enabled by external TV signal"
                     )
-                self.new_deal(data, triggerpair="")
+                await self.new_deal(data, triggerpair="")
         else:
             self.logging.info(
-                "Updating multi bot " + bot["name"] + " with filtered symrank pairs"
+                "Updating multi bot %s with filtered symrank pairs", bot["name"]
             )
-            error, data = self.p3cw.request(
+
+            # The symrank list replaces all collected pair changes. An update
+            # already on its way to 3Commas has to arrive first
+            update = pending_updates.pop(bot["id"], None)
+            if update and update["task"]:
+                if not update["sending"]:
+                    update["task"].cancel()
+                await asyncio.gather(update["task"], return_exceptions=True)
+            error, data = await self.p3cw.request(
                 entity="bots",
                 action="update",
-                action_id=botid,
-                additional_headers={"Forced-Mode": self.attributes.get("trade_mode")},
+                action_id=str(bot["id"]),
+                additional_headers={"Forced-Mode": self.settings.trade_mode},
                 payload=self.payload(pairs, mad, new_bot),
             )
 
             if error:
                 self.logging.error(error["msg"])
             else:
-                self.logging.debug("Pairs: " + str(pairs))
-                if not self.attributes.get("ext_botswitch", False):
-                    self.enable(data)
+                self.bot_data.update(data)
+                self.logging.debug("Pairs: %s", pairs)
+                if not self.settings.ext_botswitch:
+                    await self.enable(data)
                 else:
                     self.logging.info(
                         "ext_botswitch set to true, bot enabling/disabling has to be managed by external TV signal"
                     )
 
-    def trigger(self, triggeronly=False):
+    def pairs(self, bot):
+        # Pair list of the bot including changes not yet sent to 3Commas
+        if bot["id"] in pending_updates:
+            return list(pending_updates[bot["id"]]["pairs"])
+
+        return list(bot["pairs"])
+
+    async def coalesce(self, bot, pairs, triggerpair):
+        # Collects pair changes and sends them after multibot_update_window ms in
+        # one update, instead of one update per signal
+        update = pending_updates.setdefault(
+            bot["id"],
+            {"pairs": pairs, "deals": [], "task": None, "sending": False},
+        )
+        update["pairs"] = pairs
+        update["changed"] = True
+
+        if self.settings.deal_mode == "signal":
+            if triggerpair and triggerpair not in bot["pairs"] and triggerpair in pairs:
+                # 3Commas only starts deals for pairs of the bot - wait for the update
+                update["deals"].append(triggerpair)
+            else:
+                await self.new_deal(bot, triggerpair)
+
+        if update["task"] is None:
+            update["task"] = asyncio.get_running_loop().create_task(
+                self.flush(bot["id"], update)
+            )
+            update["task"].add_done_callback(self.flushed)
+
+    async def flush(self, botid, update):
+        # Sends the collected pair changes of a multibot, again after the next
+        # window if new changes arrived during the update
+        try:
+            while update["changed"] and pending_updates.get(botid) is update:
+                await asyncio.sleep(self.settings.multibot_update_window / 1000)
+
+                update["changed"] = False
+                pairs = list(update["pairs"])
+                deals = update["deals"]
+                update["deals"] = []
+
+                # Adapt mad if pairs are under value
+                mad = self.adjustmad(pairs, self.settings.mad)
+                self.logging.info(
+                    "Sending collected pair changes: %s pairs, mad adjusted to %s",
+                    len(pairs),
+                    mad,
+                )
+
+                update["sending"] = True
+                try:
+                    error, data = await self.p3cw.request(
+                        entity="bots",
+                        action="update",
+                        action_id=str(botid),
+                        additional_headers={"Forced-Mode": self.settings.trade_mode},
+                        payload=self.payload(pairs, mad, new_bot=False),
+                    )
+                finally:
+                    update["sending"] = False
+
+                if error:
+                    self.logging.error(error["msg"])
+                    continue
+
+                self.bot_data.update(data)
+
+                for pair in deals:
+                    # Skip pairs removed again by a STOP signal in the same window
+                    if pair in pairs:
+                        await self.new_deal(data, pair)
+        finally:
+            if pending_updates.get(botid) is update:
+                del pending_updates[botid]
+
+    def flushed(self, task):
+        # Done callback of flush, its errors would get lost otherwise
+        if not task.cancelled() and task.exception():
+            self.logging.error(
+                "Sending collected pair changes failed", exc_info=task.exception()
+            )
+
+    async def trigger(self, triggeronly=False):
         # Updates multi bot with new pairs
         triggerpair = ""
-        mad = self.attributes.get("mad")
+        mad = self.settings.mad
+        bot = self.bot_data.get(self.prefix + "_" + self.subprefix + "_" + self.suffix)
 
-        for bot in self.bot_data:
-            if (self.prefix + "_" + self.subprefix + "_" + self.suffix) == bot["name"]:
+        if bot:
+            if not triggeronly:
+                pair = self.tg_data.pair
+                pairs = self.pairs(bot)
 
-                if not triggeronly:
-                    pair = self.tg_data["pair"]
-
-                    self.logging.info(
-                        "Got new 3cqs " + self.tg_data["action"] + " signal for " + pair
-                    )
+                self.logging.info(
+                    "Got new 3cqs %s signal for %s",
+                    self.tg_data.action,
+                    pair,
+                    extra={"pair": pair, "action": self.tg_data.action},
+                )
 
-                    if self.tg_data["action"] == "START":
-                        triggerpair = pair
+                if self.tg_data.action == "START":
+                    triggerpair = pair
 
-                        if pair in bot["pairs"]:
-                            self.logging.info(
-                                pair + " is already included in the pair list"
-                            )
-                        else:
-                            # Filter topcoins (if set)
-                            if self.attributes.get("topcoin_filter", False):
-                                pair = self.signal.topcoin(
-                                    pair,
-                                    self.attributes.get("topcoin_limit", 3500),
-                                    self.attributes.get("topcoin_volume", 0),
-                                    self.attributes.get("topcoin_exchange", "binance"),
-                                    self.attributes.get("market"),
-                                )
-                            else:
-                                self.logging.info(
-                                    "Topcoin filter disabled, not filtering pairs!"
-                                )
-
-                            if pair:
-                                self.logging.info("Adding pair " + pair)
-                                bot["pairs"].append(pair)
+                    if pair in pairs:
+                        self.logging.info(
+                            "%s is already included in the pair list", pair
+                        )
                     else:
-                        if pair in bot["pairs"]:
-                            self.logging.info("Remove pair " + pair)
-                            bot["pairs"].remove(pair)
+                        # Filter topcoins (if set)
+                        if self.settings.topcoin_filter:
+                            pair = await self.signal.topcoin_async(
+                                pair,
+                                self.settings.topcoin_limit,
+                                self.settings.topcoin_volume,
+                                self.settings.topcoin_exchange,
+                                self.settings.market,
+                            )
                         else:
                             self.logging.info(
-                                pair + " was not included in the pair list, not removed"
+                                "Topcoin filter disabled, not filtering pairs!"
                             )
 
-                    # Adapt mad if pairs are under value
-                    mad = self.adjustmad(bot["pairs"], mad)
-                    self.logging.info(
-                        "Adjusting mad to amount of included symrank pairs: " + str(mad)
-                    )
+                        if pair:
+                            self.logging.info("Adding pair %s", pair)
+                            pairs.append(pair)
+                else:
+                    if pair in pairs:
+                        self.logging.info("Remove pair %s", pair)
+                        pairs.remove(pair)
+                    else:
+                        self.logging.info(
+                            "%s was not included in the pair list, not removed", pair
+                        )
 
-                    error, data = self.p3cw.request(
-                        entity="bots",
-                        action="update",
-                        action_id=str(bot["id"]),
-                        additional_headers={
-                            "Forced-Mode": self.attributes.get("trade_mode")
-                        },
-                        payload=self.payload(bot["pairs"], mad, new_bot=False),
-                    )
+                if self.settings.multibot_update_window > 0:
+                    await self.coalesce(bot, pairs, triggerpair)
+                    return
 
-                    if error:
-                        self.logging.error(error["msg"])
+                # Adapt mad if pairs are under value
+                mad = self.adjustmad(pairs, mad)
+                self.logging.info(
+                    "Adjusting mad to amount of included symrank pairs: %s", mad
+                )
+
+                error, data = await self.p3cw.request(
+                    entity="bots",
+                    action="update",
+                    action_id=str(bot["id"]),
+                    additional_headers={"Forced-Mode": self.settings.trade_mode},
+                    payload=self.payload(pairs, mad, new_bot=False),
+                )
+
+                if error:
+                    self.logging.error(error["msg"])
                 else:
-                    data = bot
+                    self.bot_data.update(data)
+            else:
+                data = bot
 
-                if self.attributes.get("deal_mode") == "signal" and data:
-                    self.new_deal(data, triggerpair)
+            if self.settings.deal_mode == "signal" and data:
+                await self.new_deal(data, triggerpair)
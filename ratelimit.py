@@ -0,0 +1,55 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting the calls to an external API
+
+    Every call takes one token. Tokens are refilled continuously with rate per
+    second up to capacity, so short bursts are possible while the average stays
+    at rate. acquire() blocks the calling thread until a token is available.
+
+    Parameters:
+    rate (float): Tokens per second, 0 = unlimited
+    capacity (int): Maximum number of tokens (burst size)
+
+    """
+
+    def __init__(self, rate=0, capacity=1):
+        self.lock = threading.Lock()
+        self.configure(rate, capacity)
+
+    def configure(self, rate, capacity=None):
+        with self.lock:
+            self.rate = rate
+            self.capacity = max(1, capacity or getattr(self, "capacity", 1))
+            self.tokens = self.capacity
+            self.updated = time.monotonic()
+
+    def acquire(self):
+        # Returns the seconds waited for the token
+        waited = 0.0
+
+        while True:
+            with self.lock:
+                if not self.rate:
+                    return waited
+
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+            waited += wait
+
+
+# Shared by all CoinGecko requests, configured with coingecko_rate_limit at startup
+coingecko = TokenBucket(30 / 60, 10)
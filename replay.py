@@ -0,0 +1,365 @@
+"""Replays recorded 3CQS Telegram messages offline
+
+Drives a signal_log recording through the same handler as 3cqsbot.py, with an
+in-memory 3Commas account (fake3commas.py) and an offline CoinGecko snapshot
+(fakecoingecko.py), and reports decision latency, 3Commas calls and the final
+bot state.
+
+    python replay.py signals.jsonl                  # as fast as possible
+    python replay.py signals.jsonl --speed 1        # in real time
+    python replay.py signals.jsonl -c other.ini --report result.json
+    python replay.py signals.jsonl --latency 300 --error-rate 0.05 --seed 1
+
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import sys
+
+from datetime import datetime
+from time import monotonic
+
+import fakecoingecko
+import multibot
+import signals
+import tgparser
+
+from botinventory import BotInventory
+from commas import AsyncPy3CW
+from config import Config
+from fake3commas import Fake3Commas, client
+from handler import SignalHandler
+from ratelimit import coingecko
+from signalqueue import SignalQueue
+
+# Record of the signal processed by the current task
+current = contextvars.ContextVar("current", default=None)
+
+
+class RecordingPy3CW(AsyncPy3CW):
+    # Attributes every 3Commas call to the signal that caused it
+    async def request(self, **kwargs):
+        record = current.get()
+
+        if record is not None:
+            record["calls"].append(kwargs["entity"] + "/" + kwargs.get("action", ""))
+
+        return await super().request(**kwargs)
+
+
+class ReplayHandler(SignalHandler):
+    # Measures every queued signal from receiving it until its decision is made
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.records = []
+
+    def job(self, tg_output):
+        process = super().job(tg_output)
+        record = {
+            "message": len(self.records),
+            "signal": describe(tg_output),
+            "calls": [],
+            "received": monotonic(),
+        }
+        self.records.append(record)
+
+        async def timed():
+            token = current.set(record)
+            started = monotonic()
+
+            try:
+                await process()
+            finally:
+                current.reset(token)
+                record["queued"] = started - record["received"]
+                record["latency"] = monotonic() - record["received"]
+
+        return timed
+
+
+def describe(tg_output):
+    if isinstance(tg_output, list):
+        return "symrank list (" + str(len(tg_output)) + " pairs)"
+
+    return str(tg_output.signal) + " " + tg_output.action + " " + tg_output.pair
+
+
+def read(filename):
+    # Messages of a signal_log recording ordered by date
+    messages = []
+
+    with open(filename, encoding="utf-8") as log:
+        for number, line in enumerate(log, 1):
+            if not line.strip():
+                continue
+
+            try:
+                message = json.loads(line)
+                messages.append(
+                    (datetime.fromisoformat(message["date"]), message["text"])
+                )
+            except (ValueError, KeyError):
+                logging.warning(
+                    "Skipping invalid line " + str(number) + " of " + filename
+                )
+
+    messages.sort(key=lambda message: message[0])
+
+    return messages
+
+
+def market_pairs(messages, market, snapshot):
+    # All pairs of the recording and the snapshot are tradeable on the fake account
+    pairs = set(market + "_" + coin["symbol"].upper() for coin in snapshot)
+
+    for date, text in messages:
+        parsed = tgparser.parse(text, market)
+
+        if isinstance(parsed, list):
+            pairs.update(market + "_" + token for token in parsed)
+        elif parsed:
+            pairs.add(parsed.pair)
+
+    return sorted(pairs)
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+async def replay(messages, handler, signalqueue, speed):
+    await handler.load()
+    signalqueue.start(asyncio.get_running_loop())
+
+    started = monotonic()
+
+    for date, text in messages:
+        if speed > 0:
+            delay = (date - messages[0][0]).total_seconds() / speed
+            delay -= monotonic() - started
+
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        await handler.handle(text)
+
+    await signalqueue.queue.join()
+
+    # Pair changes of the multibot are sent after multibot_update_window
+    while multibot.pending_updates:
+        await asyncio.sleep(0.01)
+
+    for task in signalqueue.tasks:
+        task.cancel()
+
+    return monotonic() - started
+
+
+def report(handler, fake, transport, elapsed, messages):
+    records = handler.records
+    latency = [record["latency"] * 1000 for record in records if "latency" in record]
+    calls = {}
+
+    for entity, action in fake.calls:
+        endpoint = entity + "/" + action
+        calls[endpoint] = calls.get(endpoint, 0) + 1
+
+    bots = []
+    for bot in fake.bots.values():
+        bots.append(
+            {
+                "name": bot["name"],
+                "enabled": bot["is_enabled"],
+                "pairs": bot["pairs"],
+                "active_deals": bot["active_deals_count"],
+            }
+        )
+
+    return {
+        "messages": len(messages),
+        "signals": len(records),
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(records) / elapsed, 2) if elapsed else 0,
+        "latency_ms": {
+            "avg": round(sum(latency) / len(latency), 3) if latency else 0,
+            "p50": round(percentile(latency, 50), 3),
+            "p95": round(percentile(latency, 95), 3),
+            "max": round(max(latency), 3) if latency else 0,
+        },
+        "calls_3commas": calls,
+        "transport": dict(transport.stats),
+        "calls_coingecko": dict(fakecoingecko.FakeCoinGeckoAPI.calls),
+        "bots": bots,
+        "deals": [deal["pair"] for deal in fake.deals],
+        "decisions": [
+            {
+                "message": record["message"],
+                "signal": record["signal"],
+                "latency_ms": round(record.get("latency", 0) * 1000, 3),
+                "queued_ms": round(record.get("queued", 0) * 1000, 3),
+                "calls": record["calls"],
+            }
+            for record in records
+        ],
+    }
+
+
+def show(result):
+    print(
+        "Replayed "
+        + str(result["messages"])
+        + " messages with "
+        + str(result["signals"])
+        + " signals in "
+        + str(result["elapsed"])
+        + "s ("
+        + str(result["throughput"])
+        + " signals/s)"
+    )
+    print(
+        "Decision latency: "
+        + ", ".join(
+            name + " " + str(value) + "ms"
+            for name, value in result["latency_ms"].items()
+        )
+    )
+    print("3Commas calls:")
+    for endpoint, count in sorted(result["calls_3commas"].items()):
+        print("    " + endpoint + ": " + str(count))
+    print(
+        "3Commas transport: "
+        + ", ".join(
+            name + " " + str(value) for name, value in result["transport"].items()
+        )
+    )
+    print("CoinGecko calls:")
+    for endpoint, count in sorted(result["calls_coingecko"].items()):
+        print("    " + endpoint + ": " + str(count))
+    print("Bots:")
+    for bot in result["bots"]:
+        print(
+            "    "
+            + bot["name"]
+            + (" (enabled)" if bot["enabled"] else " (disabled)")
+            + ", "
+            + str(len(bot["pairs"]))
+            + " pairs, "
+            + str(bot["active_deals"])
+            + " active deals"
+        )
+    print("Deals started: " + ", ".join(result["deals"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("log", help="recorded messages (signal_log of 3cqsbot)")
+    parser.add_argument("-c", "--config", default="config.ini", help="config file")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0,
+        help="1 = original timing, 10 = ten times faster, 0 = as fast as possible",
+    )
+    parser.add_argument("--market", help="recorded CoinGecko snapshot (JSON)")
+    parser.add_argument("--report", help="write the full report as JSON")
+    parser.add_argument(
+        "--latency", type=float, default=0, help="ms every 3Commas call takes"
+    )
+    parser.add_argument(
+        "--jitter", type=float, default=0, help="additional random ms per call"
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=0,
+        help="3Commas calls per second before answering with 429, 0 = off",
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0,
+        help="share of 3Commas calls failing with 5xx (0 - 1)",
+    )
+    parser.add_argument("--seed", type=int, help="seed for jitter and errors")
+    parser.add_argument(
+        "-l", "--loglevel", default="warning", help="loglevel of 3cqsbot output"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        format="%(asctime)s %(levelname)-8s %(message)s",
+        level=getattr(logging, args.loglevel.upper(), logging.WARNING),
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+
+    attributes = Config(args.config)
+    settings = attributes.settings
+
+    if args.market:
+        snapshot = fakecoingecko.load(args.market)
+    else:
+        snapshot = fakecoingecko.synthetic_markets()
+
+    fakecoingecko.FakeCoinGeckoAPI.use(snapshot)
+    signals.CoinGeckoAPI = fakecoingecko.FakeCoinGeckoAPI
+    coingecko.configure(0)
+
+    messages = read(args.log)
+
+    fake = Fake3Commas(
+        settings.account_name, market_pairs(messages, settings.market, snapshot)
+    )
+    # Real Py3CW client (with the configured retries) talking to the fake account
+    py3cw = client(
+        fake,
+        request_options={
+            "request_timeout": settings.timeout,
+            "nr_of_retries": settings.retries,
+            "retry_backoff_factor": settings.delay_between_retries,
+        },
+        latency=args.latency / 1000,
+        jitter=args.jitter / 1000,
+        rate_limit=args.rate_limit,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    p3cw = RecordingPy3CW(py3cw, workers=settings.api_workers)
+    bots = BotInventory(attributes, p3cw, logging)
+    signalqueue = SignalQueue(
+        logging,
+        workers=settings.signal_workers,
+        size=settings.signal_queue_size,
+        stats_interval=0,
+    )
+
+    # No BTC pulse while replaying - every signal is processed
+    state = type("", (), {})()
+    state.btcbool = False
+    state.accountData = {}
+    state.pairData = []
+
+    handler = ReplayHandler(attributes, p3cw, bots, signalqueue, state, logging)
+
+    elapsed = asyncio.run(replay(messages, handler, signalqueue, args.speed))
+    p3cw.shutdown()
+
+    result = report(handler, fake, py3cw.transport, elapsed, messages)
+    show(result)
+
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump(result, file, indent=4)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import asyncio
+
+from collections import deque
+from time import monotonic
+
+
+class SignalQueue:
+    """Bounded work queue between the Telegram handler and the bot logic
+
+    Signals are processed by a pool of workers. Jobs sharing the same key (a pair
+    for single bots, the multibot for multi bots) run one after another in the
+    order they were queued, jobs with different keys run in parallel. A job for a
+    key which is already processed is parked behind it, so a burst for one key
+    does not block the other workers. When size signals are waiting, put() waits
+    until one has been processed (backpressure).
+
+    Parameters:
+    logging: Logging facility
+    workers (int): Number of workers processing signals
+    size (int): Maximum number of waiting signals
+    stats_interval (int): Seconds between queue statistics in the log, 0 = off
+
+    """
+
+    def __init__(self, logging, workers=4, size=100, stats_interval=300):
+        self.logging = logging
+        self.workers = workers
+        self.size = size
+        self.stats_interval = stats_interval
+        self.queue = None
+        self.slots = None
+        self.tasks = []
+        # Keys being processed with their parked jobs
+        self.busy = {}
+        self.stats = {
+            "queued": 0,
+            "processed": 0,
+            "failed": 0,
+            "max_depth": 0,
+            "max_wait": 0.0,
+            "total_wait": 0.0,
+        }
+
+    def open(self):
+        # The queue has to be created on the running event loop. Signals put
+        # before start() wait in the queue until the workers are running
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+            self.slots = asyncio.Semaphore(self.size)
+
+    def start(self, loop):
+        self.open()
+
+        for i in range(self.workers):
+            self.tasks.append(loop.create_task(self.worker()))
+
+        if self.stats_interval > 0:
+            self.tasks.append(loop.create_task(self.report()))
+
+        return self.tasks
+
+    def depth(self):
+        # Waiting signals, queued or parked behind their key
+        if self.queue is None:
+            return 0
+
+        return self.queue.qsize() + sum(len(parked) for parked in self.busy.values())
+
+    async def put(self, key, job):
+        # job is a coroutine function without arguments
+        self.open()
+
+        if self.slots.locked():
+            self.logging.warning(
+                "Signal queue full (%s signals) - waiting for free workers", self.size
+            )
+
+        await self.slots.acquire()
+        self.queue.put_nowait((key, job, monotonic()))
+
+        self.stats["queued"] += 1
+        self.stats["max_depth"] = max(self.stats["max_depth"], self.depth())
+
+    async def worker(self):
+        while True:
+            key, job, queued = await self.queue.get()
+
+            if key in self.busy:
+                # Another worker processes this key and takes the job afterwards
+                self.busy[key].append((job, queued))
+                continue
+
+            self.busy[key] = deque()
+
+            while True:
+                await self.run(key, job, queued)
+
+                if not self.busy[key]:
+                    del self.busy[key]
+                    break
+
+                job, queued = self.busy[key].popleft()
+
+    async def run(self, key, job, queued):
+        wait = monotonic() - queued
+        self.stats["total_wait"] += wait
+        self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+
+        try:
+            await job()
+
+            self.stats["processed"] += 1
+        except Exception:  # pylint: disable=broad-except
+            self.stats["failed"] += 1
+            self.logging.exception("Processing signal for %s failed", key)
+        finally:
+            self.slots.release()
+            self.queue.task_done()
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+
+            done = self.stats["processed"] + self.stats["failed"]
+            average = self.stats["total_wait"] / done if done else 0
+
+            self.logging.info(
+                "Signal queue: depth %s (max %s), queued %s, processed %s, failed %s, "
+                "wait avg %.3fs (max %.3fs)",
+                self.depth(),
+                self.stats["max_depth"],
+                self.stats["queued"],
+                self.stats["processed"],
+                self.stats["failed"],
+                average,
+                self.stats["max_wait"],
+            )
@@ -1,80 +1,341 @@
-import yfinance as yf
 import numpy as np
 import asyncio
 import math
 import re
 import babel.numbers
-
+import threading
+import time
+
+from cache import timed_cache
+from candles import CandleBuffer
+from collections import OrderedDict
+from logqueue import Lazy
+from marketdata import YFinanceProvider
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ratelimit import coingecko
 from pycoingecko import CoinGeckoAPI
-from tenacity import retry, wait_fixed
-from functools import lru_cache, wraps
-from time import monotonic_ns
+from tenacity import retry, stop_after_delay, wait_random_exponential
+
+# Coin ids per batched ticker request
+TICKER_BATCH = 50
+
+# Candles per vectorized EMA block and the largest decay^-t within a block (log)
+EMA_BLOCK = 4096
+EMA_PRECISION = math.log(1e6)
+
+# Seconds to retry a btc-pulse download and age of the last candle (seconds)
+# after which the data is outdated and btc_pulse_fallback is used
+BTC_PULSE_RETRY = 240
+BTC_PULSE_STALE = 900
+
+# Coins per page and pages loaded in parallel of the CoinGecko market list
+MARKET_PAGE = 250
+MARKET_WORKERS = 4
+
+
+def currency(value, symbol):
+    # Formatted by babel only if the log message is rendered
+    return Lazy(babel.numbers.format_currency, value, symbol, locale="en_US")
+
+
+class MarketLoad:
+    """Parallel load of the CoinGecko market list up to a rank
+
+    The pages are requested in parallel (limited by the CoinGecko rate limit) and
+    merged into the symbol index as they arrive. A load is shared by all callers
+    asking for the same rank while it runs.
+
+    Parameters:
+    rank (int): Market cap rank to load the market list up to
+
+    """
+
+    loads = {}
+    lock = threading.Lock()
+
+    def __init__(self, rank):
+        self.rank = rank
+        self.pages = max(1, math.ceil(rank / MARKET_PAGE))
+        self.market = {}
+        self.found = {}
+        self.arrived = set()
+        self.complete = 0
+        self.error = None
+        self.finished = False
+        self.condition = threading.Condition()
+
+    @classmethod
+    def start(cls, rank):
+        # Returns the running load for rank or starts a new one
+        with cls.lock:
+            load = cls.loads.get(rank)
+
+            if load is None:
+                load = cls.loads[rank] = cls(rank)
+                threading.Thread(target=load.run, name="cgmarket", daemon=True).start()
+
+        return load
+
+    def fetch(self, page):
+        coingecko.acquire()
+
+        return CoinGeckoAPI().get_coins_markets(
+            vs_currency="usd", page=page, per_page=MARKET_PAGE
+        )
+
+    def run(self):
+        try:
+            with ThreadPoolExecutor(max_workers=MARKET_WORKERS) as executor:
+                futures = {
+                    executor.submit(self.fetch, page): page
+                    for page in range(1, self.pages + 1)
+                }
+
+                for future in as_completed(futures):
+                    self.add(futures[future], future.result())
+        except Exception as error:  # pylint: disable=broad-except
+            with self.condition:
+                self.error = error
+        finally:
+            with MarketLoad.lock:
+                MarketLoad.loads.pop(self.rank, None)
+
+            with self.condition:
+                self.finished = True
+                self.condition.notify_all()
+
+    def add(self, page, entries):
+        with self.condition:
+            for entry in entries:
+                if entry["market_cap_rank"] is None:
+                    continue
+
+                # Symbols are not unique - keep the coin with the best rank
+                coin = self.market.get(entry["symbol"])
+                if coin is None or entry["market_cap_rank"] < coin[1]:
+                    self.market[entry["symbol"]] = (
+                        entry["id"],
+                        int(entry["market_cap_rank"]),
+                    )
+
+                if page < self.found.get(entry["symbol"], self.pages + 1):
+                    self.found[entry["symbol"]] = page
+
+            # Number of pages arrived without a gap from the first one
+            self.arrived.add(page)
+            while self.complete + 1 in self.arrived:
+                self.complete += 1
+
+            self.condition.notify_all()
+
+    def find(self, symbol):
+        # Waits until the best ranked coin with symbol is known
+        with self.condition:
+            while True:
+                if self.error:
+                    raise self.error
+                if self.found.get(symbol, self.pages + 1) <= self.complete:
+                    return self.market[symbol]
+                if self.finished:
+                    return self.market.get(symbol)
+
+                self.condition.wait()
+
+    def result(self):
+        # Waits for the complete index
+        with self.condition:
+            while not self.finished:
+                self.condition.wait()
+
+            if self.error:
+                raise self.error
+
+            return self.market
+
+
+class TopcoinCache:
+    """Decisions of the top coin filter per pair
+
+    Repeated signals of a pair skip the market list lookup, the ticker scan and
+    the volume logging. A decision expires after seconds and all decisions are
+    dropped when the market list or the tickers they were made with are
+    refreshed (the snapshot changes).
+
+    Parameters:
+    seconds (int): Time to live of a decision, 0 = disabled
+    maxsize (int): Maximum number of decisions
+
+    """
+
+    def __init__(self, seconds=0, maxsize=1024):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.snapshot = None
+        self.configure(seconds, maxsize)
+
+    def configure(self, seconds, maxsize=None):
+        with self.lock:
+            self.seconds = seconds
+            self.maxsize = maxsize or self.maxsize
+            self.entries.clear()
+
+    def invalidate(self, snapshot):
+        # Drops all decisions made with another snapshot, the caller holds the lock
+        if snapshot != self.snapshot:
+            self.entries.clear()
+            self.snapshot = snapshot
+
+    def get(self, keys, snapshot):
+        # Valid decisions of keys, unknown and expired ones are missing
+        if not self.seconds:
+            return {}
+
+        decisions = {}
+        now = time.monotonic()
+
+        with self.lock:
+            self.invalidate(snapshot)
+
+            for key in keys:
+                entry = self.entries.get(key)
+
+                if entry is not None and entry[1] > now:
+                    self.entries.move_to_end(key)
+                    decisions[key] = entry[0]
+
+        return decisions
+
+    def set(self, decisions, snapshot):
+        # Stores the decisions (key -> passed) made with snapshot
+        if not self.seconds:
+            return
+
+        expires = time.monotonic() + self.seconds
+
+        with self.lock:
+            self.invalidate(snapshot)
+
+            for key, decision in decisions.items():
+                self.entries[key] = (decision, expires)
+                self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+# Shared by all bots, configured with topcoin_cache at startup
+topcoin_cache = TopcoinCache()
 
 
 class Signals:
-    def __init__(self, logging):
+    def __init__(self, logging, provider=None):
         self.logging = logging
-
-    # Credits goes to https://gist.github.com/Morreski/c1d08a3afa4040815eafd3891e16b945
-    def timed_lru_cache(
-        _func=None, *, seconds: int = 600, maxsize: int = 128, typed: bool = False
-    ):
-        """Extension of functools lru_cache with a timeout
-
-        Parameters:
-        seconds (int): Timeout in seconds to clear the WHOLE cache, default = 10 minutes
-        maxsize (int): Maximum Size of the Cache
-        typed (bool): Same value of different type will be a different entry
-
-        """
-
-        def wrapper_cache(f):
-            f = lru_cache(maxsize=maxsize, typed=typed)(f)
-            f.delta = seconds * 10**9
-            f.expiration = monotonic_ns() + f.delta
-
-            @wraps(f)
-            def wrapped_f(*args, **kwargs):
-                if monotonic_ns() >= f.expiration:
-                    f.cache_clear()
-                    f.expiration = monotonic_ns() + f.delta
-                return f(*args, **kwargs)
-
-            wrapped_f.cache_info = f.cache_info
-            wrapped_f.cache_clear = f.cache_clear
-            return wrapped_f
-
-        # To allow decorator to be used without arguments
-        if _func is None:
-            return wrapper_cache
-        else:
-            return wrapper_cache(_func)
+        # Source of the btc-pulse candles (marketdata.py)
+        self.provider = provider or YFinanceProvider()
+        # 6 hours of 5 minute candles and the state (True = downtrend) per coin
+        self.candles = {
+            coin: CandleBuffer(size=72, periods=(9, 50)) for coin in self.provider.coins
+        }
+        self.pulses = dict.fromkeys(self.provider.coins)
+        # Coins with a downtrend to confirm with the next candle
+        self.pending = set()
+        # Set whenever asyncState.btcbool flips, awaited by the botswitch
+        self.changed = asyncio.Event()
 
     @staticmethod
-    @timed_lru_cache(seconds=10800)
+    @timed_cache(seconds=10800, persistent=True)
     def cgexchanges(exchange, id):
         cg = CoinGeckoAPI()
+        coingecko.acquire()
         exchange = cg.get_exchanges_tickers_by_id(id=exchange, coin_ids=id)
 
         return exchange
 
     @staticmethod
-    @timed_lru_cache(seconds=10800)
-    def cgvalues(rank):
+    def cgbatch(exchange, ids):
+        # Tickers of several coins with one request per 100 tickers
         cg = CoinGeckoAPI()
-        market = []
+        tickers = {id: [] for id in ids}
+        name = exchange
+        page = 1
 
-        if rank <= 250:
-            pages = 1
-        else:
-            pages = math.ceil(rank / 250)
+        while True:
+            coingecko.acquire()
+            data = cg.get_exchanges_tickers_by_id(
+                id=exchange, coin_ids=",".join(ids), page=page
+            )
+            name = data.get("name", exchange)
+
+            for ticker in data["tickers"]:
+                if ticker.get("coin_id") in tickers:
+                    tickers[ticker["coin_id"]].append(ticker)
+
+            if len(data["tickers"]) < 100:
+                break
+
+            page += 1
+
+        return {id: {"name": name, "tickers": tickers[id]} for id in ids}
+
+    def cgtickers(self, exchange, ids):
+        # Fills the cgexchanges cache for all coins with batched, parallel requests.
+        # Expired entries are reloaded in the batches too, instead of one
+        # background refresh per coin
+        missing = [
+            id
+            for id in dict.fromkeys(ids)
+            if self.cgexchanges.fresh(exchange, id) is None
+        ]
+
+        if not missing:
+            return
+
+        batches = [
+            missing[i : i + TICKER_BATCH] for i in range(0, len(missing), TICKER_BATCH)
+        ]
+
+        def load(batch):
+            try:
+                return self.cgbatch(exchange, batch)
+            except Exception as error:  # pylint: disable=broad-except
+                # topvolume requests these coins one by one
+                self.logging.warning(
+                    "Loading tickers of %s coins failed: %s", len(batch), error
+                )
+                return {}
+
+        with ThreadPoolExecutor(max_workers=min(len(batches), 4)) as executor:
+            for result in executor.map(load, batches):
+                for id, tickers in result.items():
+                    self.cgexchanges.set((exchange, id), tickers)
+
+        self.logging.debug(
+            "Loaded tickers of %s coins with %s batched request(s)",
+            len(missing),
+            len(batches),
+        )
+
+    @staticmethod
+    @timed_cache(seconds=10800, persistent=True)
+    def cgvalues(rank):
+        # Index of the market data: symbol -> (coingecko id, market cap rank)
+        return MarketLoad.start(rank).result()
 
-        for page in range(1, pages + 1):
-            page = cg.get_coins_markets(vs_currency="usd", page=page, per_page=250)
-            for entry in page:
-                market.append(entry)
+    def cgrank(self, symbol, rank):
+        # (coingecko id, market cap rank) of one symbol. With a cold cache this
+        # returns as soon as the page with the symbol and all pages before it
+        # arrived, the rest of the market list is cached in the background
+        market = self.cgvalues.get(rank)
 
-        return market
+        if market is not None:
+            return market.get(symbol)
+
+        load = MarketLoad.start(rank)
+        threading.Thread(
+            target=self.cgvalues, args=(rank,), name="cgvalues", daemon=True
+        ).start()
+
+        return load.find(symbol)
 
     def topvolume(self, id, volume, exchange, market):
         # Check if topcoin has enough volume
@@ -84,215 +345,323 @@ class Signals:
 
             exchange = self.cgexchanges(exchange, id)
 
-            self.logging.debug(self.cgvalues.cache_info())
+            self.logging.debug("%s", self.cgvalues.cache_info())
 
             for target in exchange["tickers"]:
-                converted_btc = babel.numbers.format_currency(
-                    target["converted_volume"]["btc"], "", locale="en_US"
-                )
-                converted_usd = babel.numbers.format_currency(
-                    target["converted_volume"]["usd"], "USD", locale="en_US"
-                )
-                btc_price = (
-                    target["converted_volume"]["usd"]
-                    / target["converted_volume"]["btc"]
-                )
-                configured_usd = babel.numbers.format_currency(
-                    (volume * btc_price),
-                    "USD",
-                    locale="en_US",
-                )
-                if (
-                    target["target"] == market
-                    and target["converted_volume"]["btc"] >= volume
-                ):
-                    volume_target = True
-                    self.logging.info(
-                        str(target["base"])
-                        + " daily volume is "
-                        + converted_btc
-                        + " BTC ("
-                        + converted_usd
-                        + ") and over the configured value of "
-                        + str(volume)
-                        + " BTC ("
-                        + configured_usd
-                        + ")"
-                    )
-                    break
-                elif (
-                    target["target"] == market
-                    and target["converted_volume"]["btc"] < volume
-                ):
-                    volume_target = False
-                    self.logging.info(
-                        str(target["base"])
-                        + " daily volume is "
-                        + converted_btc
-                        + " BTC ("
-                        + converted_usd
-                        + ") NOT passing the minimum daily BTC volume of "
-                        + str(volume)
-                        + " BTC ("
-                        + configured_usd
-                        + ")"
-                    )
-                    break
-                else:
+                if target["target"] != market:
                     volume_target = False
+                    continue
+
+                converted = target["converted_volume"]
+                btc_price = converted["usd"] / converted["btc"]
+                volume_target = converted["btc"] >= volume
+
+                self.logging.info(
+                    "%s daily volume is %s BTC (%s) %s of %s BTC (%s)",
+                    target["base"],
+                    currency(converted["btc"], ""),
+                    currency(converted["usd"], "USD"),
+                    (
+                        "and over the configured value"
+                        if volume_target
+                        else "NOT passing the minimum daily BTC volume"
+                    ),
+                    volume,
+                    currency(volume * btc_price, "USD"),
+                    extra={"coin": id, "volume_btc": converted["btc"]},
+                )
+                break
         else:
             volume_target = True
 
         return volume_target
 
-    def topcoin(self, pairs, rank, volume, exchange, trademarket):
+    def snapshot(self):
+        # Changes when the market list or tickers of the top coin filter refresh
+        return (self.cgvalues.generation, self.cgexchanges.generation)
 
+    def topfilter(self, pairs, rank, volume, exchange, trademarket):
+        # Symrank pairs passing the top coin filter
         market = self.cgvalues(rank)
+        pairlist = []
+        candidates = []
+
+        for pair in pairs:
+            coin = market.get(pair.lower())
+
+            if coin and coin[1] <= rank:
+                self.logging.info(
+                    "%s is ranked #%s and has passed marketcap filter limit of #%s",
+                    pair,
+                    coin[1],
+                    rank,
+                    extra={"pair": pair, "rank": coin[1]},
+                )
+                candidates.append((pair, coin))
+
+        if volume > 0:
+            self.cgtickers(exchange, [coin[0] for pair, coin in candidates])
+
+        for pair, coin in candidates:
+            # Check if topcoin has enough volume
+            if self.topvolume(coin[0], volume, exchange, trademarket):
+                pairlist.append(pair)
+
+        return pairlist
+
+    def topcached(self, pairs, rank, volume, exchange, trademarket):
+        # topfilter for the symrank pairs without a cached decision
+        keys = {pair: (pair, rank, volume, exchange, trademarket) for pair in pairs}
+        decided = topcoin_cache.get(keys.values(), self.snapshot())
+        undecided = [pair for pair, key in keys.items() if key not in decided]
+
+        if len(undecided) < len(keys):
+            self.logging.debug(
+                "Cached top coin filter decision(s) for %s symrank pair(s)",
+                len(keys) - len(undecided),
+            )
+
+        if undecided:
+            passed = set(self.topfilter(undecided, rank, volume, exchange, trademarket))
+            decisions = {keys[pair]: pair in passed for pair in undecided}
+            topcoin_cache.set(decisions, self.snapshot())
+            decided.update(decisions)
+
+        return [pair for pair in pairs if decided[keys[pair]]]
+
+    def topcoin(self, pairs, rank, volume, exchange, trademarket):
 
-        self.logging.debug(self.cgvalues.cache_info())
+        self.logging.debug("%s", self.cgvalues.cache_info())
         self.logging.info(
-            "Applying CG's top coin filter settings: marketcap <= "
-            + str(rank)
-            + " with daily BTC volume >= "
-            + str(volume)
-            + " on "
-            + str(exchange)
+            "Applying CG's top coin filter settings: marketcap <= %s with daily "
+            "BTC volume >= %s on %s",
+            rank,
+            volume,
+            exchange,
         )
 
         if isinstance(pairs, list):
             self.logging.info(
-                str(len(pairs))
-                + " symrank pair(s) BEFORE top coin filter: "
-                + str(pairs)
+                "%s symrank pair(s) BEFORE top coin filter: %s", len(pairs), pairs
             )
-            pairlist = []
-            for pair in pairs:
-                for symbol in market:
-                    coin = pair
-                    if (
-                        coin.lower() == symbol["symbol"]
-                        and int(symbol["market_cap_rank"]) <= rank
-                    ):
-                        self.logging.info(
-                            str(pair)
-                            + " is ranked #"
-                            + str(symbol["market_cap_rank"])
-                            + " and has passed marketcap filter limit of #"
-                            + str(rank)
-                        )
-                        # Check if topcoin has enough volume
-                        if self.topvolume(symbol["id"], volume, exchange, trademarket):
-                            pairlist.append(pair)
-                            break
+            if topcoin_cache.seconds:
+                pairlist = self.topcached(pairs, rank, volume, exchange, trademarket)
+            else:
+                pairlist = self.topfilter(pairs, rank, volume, exchange, trademarket)
         else:
-            pairlist = ""
-            coin = re.search("(\w+)_(\w+)", pairs).group(2)
-
-            for symbol in market:
-                if (
-                    coin.lower() == symbol["symbol"]
-                    and int(symbol["market_cap_rank"]) <= rank
-                ):
+            key = (pairs, rank, volume, exchange, trademarket)
+            passed = topcoin_cache.get([key], self.snapshot()).get(key)
+
+            if passed is None:
+                passed = False
+                coin = self.cgrank(
+                    re.search("(\\w+)_(\\w+)", pairs).group(2).lower(), rank
+                )
+
+                if coin and coin[1] <= rank:
                     self.logging.info(
-                        str(pairs)
-                        + " is ranked #"
-                        + str(symbol["market_cap_rank"])
-                        + " and has passed marketcap filter limit of #"
-                        + str(rank)
+                        "%s is ranked #%s and has passed marketcap filter limit "
+                        "of #%s",
+                        pairs,
+                        coin[1],
+                        rank,
+                        extra={"pair": pairs, "rank": coin[1]},
                     )
                     # Check if topcoin has enough volume
-                    if self.topvolume(symbol["id"], volume, exchange, trademarket):
-                        pairlist = pairs
-                        break
+                    passed = self.topvolume(coin[0], volume, exchange, trademarket)
+
+                topcoin_cache.set({key: passed}, self.snapshot())
+            else:
+                self.logging.debug("Cached top coin filter decision for %s", pairs)
+
+            pairlist = pairs if passed else ""
 
         if not pairlist:
-            self.logging.info(str(pairs) + " did not match the topcoin filter criteria")
+            self.logging.info("%s did not match the topcoin filter criteria", pairs)
         else:
             if isinstance(pairlist, str):
-                self.logging.info(str(pairlist) + " matching top coin filter criteria")
+                self.logging.info("%s matching top coin filter criteria", pairlist)
             else:
                 self.logging.info(
-                    str(len(pairlist))
-                    + " symrank pair(s) AFTER top coin filter: "
-                    + str(pairlist)
+                    "%s symrank pair(s) AFTER top coin filter: %s",
+                    len(pairlist),
+                    pairlist,
                 )
 
         return pairlist
 
+    async def topcoin_async(self, pairs, rank, volume, exchange, trademarket):
+        # CoinGecko requests are blocking - keep them away from the event loop
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(
+            None, self.topcoin, pairs, rank, volume, exchange, trademarket
+        )
+
     # Credits goes to @IamtheOnewhoKnocks from
     # https://discord.gg/tradealts
     def ema(self, data, period, smoothing=2):
-        # Calculate EMA without dependency for TA-Lib
-        ema = [sum(data[:period]) / period]
-
-        for price in data[period:]:
-            ema.append(
-                (price * (smoothing / (1 + period)))
-                + ema[-1] * (1 - (smoothing / (1 + period)))
+        # Calculate EMA without dependency for TA-Lib. Seeded with the simple
+        # average of the first period values, NaN before - aligned with data
+        if period < 1:
+            raise ValueError("EMA period has to be at least 1")
+
+        data = np.asarray(data, dtype=float)
+        ema = np.full(len(data), np.nan)
+
+        if len(data) < period:
+            return ema
+
+        alpha = smoothing / (1 + period)
+        decay = 1 - alpha
+        ema[period - 1] = data[:period].mean()
+
+        if decay == 0:
+            ema[period:] = alpha * data[period:]
+            return ema
+
+        # y[t] = decay^t * (y[0] + alpha * sum(x[k] / decay^k)) in blocks short
+        # enough that decay^-t stays small and the sum precise
+        block = EMA_BLOCK
+        if abs(decay) < 1:
+            block = int(EMA_PRECISION / -math.log(abs(decay)))
+            block = max(1, min(block, EMA_BLOCK))
+
+        start = period
+
+        while start < len(data):
+            end = min(start + block, len(data))
+            weights = decay ** np.arange(1, end - start + 1)
+            ema[start:end] = weights * (
+                ema[start - 1] + alpha * np.cumsum(data[start:end] / weights)
             )
-
-        for i in range(period - 1):
-            ema.insert(0, np.nan)
+            start = end
 
         return ema
 
-    # Credits goes to @IamtheOnewhoKnocks from
-    # https://discord.gg/tradealts
-    @retry(wait=wait_fixed(2))
-    def btctechnical(self, symbol):
-        btcusdt = yf.download(
-            tickers=symbol, period="6h", interval="5m", progress=False
+    @retry(
+        wait=wait_random_exponential(multiplier=2, max=60),
+        stop=stop_after_delay(BTC_PULSE_RETRY),
+        reraise=True,
+    )
+    async def btccandles(self):
+        # Adds the new candles of all coins with one download of the provider,
+        # retries wait without blocking the event loop
+        self.logging.debug(
+            "%s new or updated candle(s) of %s",
+            await self.provider.load(self.candles),
+            ", ".join(self.provider.coins),
         )
-        if len(btcusdt) > 0:
-            btcusdt = btcusdt.iloc[:, :5]
-            btcusdt.columns = ["Time", "Open", "High", "Low", "Close"]
-            btcusdt = btcusdt.astype(float)
-            btcusdt["EMA9"] = self.ema(btcusdt["Close"], 9)
-            btcusdt["EMA50"] = self.ema(btcusdt["Close"], 50)
-            btcusdt["per_5mins"] = (np.log(btcusdt["Close"].pct_change() + 1)) * 100
-            btcusdt["percentchange_15mins"] = (
-                np.log(btcusdt["Close"].pct_change(3) + 1)
-            ) * 100
+
+        return self.candles
+
+    async def btcpulse(self):
+        # Current candles per coin, None if they cannot be loaded or are outdated
+        try:
+            buffers = await self.btccandles()
+        except Exception as error:  # pylint: disable=broad-except
+            self.logging.warning("btc-pulse cannot load the candles: %s", error)
+            return dict.fromkeys(self.candles)
+
+        current = {}
+        for coin, candles in buffers.items():
+            age = self.provider.now() - candles.last if len(candles) else None
+
+            if age is None or age > BTC_PULSE_STALE:
+                self.logging.warning(
+                    "btc-pulse data of %s is outdated, last candle is %s minutes old",
+                    coin,
+                    int(age / 60) if age is not None else "-",
+                )
+                current[coin] = None
+            else:
+                current[coin] = candles
+
+        return current
+
+    def crossed(self, candles):
+        # EMA50 was above EMA9 on the candle before the last one
+        return candles.ema(50, -2) > candles.ema(9, -2)
+
+    def trend(self, coin, candles, fallback):
+        # Next state of a coin (True = downtrend), evaluated once per candle. A
+        # downtrend is confirmed with the next candle - unless the fast EMA has
+        # crossed the slow one from below in between
+        state = self.pulses[coin]
+
+        if candles is None:
+            if fallback != "keep":
+                state = fallback == "downtrend"
+            self.logging.info("%s pulse falling back to %s", coin, fallback)
+            self.pending.discard(coin)
+        elif coin in self.pending:
+            self.pending.discard(coin)
+            state = not (candles.ema(9) > candles.ema(50) and self.crossed(candles))
+            self.logging.info(
+                "%s pulse signaling %s", coin, "downtrend" if state else "uptrend"
+            )
+        elif candles.change(3) < -1 or candles.ema(50) > candles.ema(9):
+            self.pending.add(coin)
+            self.logging.info("%s pulse signaling downtrend", coin)
         else:
-            raise IOError("Downloading YFinance chart broken, retry....")
+            state = False
+            self.logging.info("%s pulse signaling uptrend", coin)
+
+        return state
 
-        return btcusdt
+    def combine(self, rule):
+        # Downtrend of the market from the states of all coins (btc_pulse_rule),
+        # None while no coin has a state
+        states = [state for state in self.pulses.values() if state is not None]
+
+        if not states:
+            return None
+        if rule == "all":
+            return all(states)
+        if rule == "majority":
+            return sum(states) > len(states) / 2
+
+        return any(states)
 
     # Credits goes to @IamtheOnewhoKnocks from
     # https://discord.gg/tradealts
-    async def getbtcbool(self, asyncState):
-
-        self.logging.info("Starting btc-pulse")
+    async def getbtcbool(self, asyncState, attributes):
+        # The per coin states (True = downtrend) are exposed as asyncState.pulse
+        self.logging.info("Starting btc-pulse for %s", ", ".join(self.provider.coins))
+        asyncState.pulse = self.pulses
 
         while True:
-            btcusdt = self.btctechnical("BTC-USD")
-            # if EMA 50 > EMA9 or <-1% drop then the sleep mode is activated
-            # else bool is false and while loop is broken
-            if (
-                btcusdt.percentchange_15mins[-1] < -1
-                or btcusdt.EMA50[-1] > btcusdt.EMA9[-1]
-            ):
-                self.logging.info("btc-pulse signaling downtrend")
-
-                # after 5mins getting the latest BTC data to see if it has had a sharp rise in previous 5 mins
-                await asyncio.sleep(300)
-                btcusdt = self.btctechnical("BTC-USD")
-
-                # this is the golden cross check fast moving EMA
-                # cuts slow moving EMA from bottom, if that is true then bool=false and break while loop
-                if (
-                    btcusdt.EMA9[-1] > btcusdt.EMA50[-1]
-                    and btcusdt.EMA50[-2] > btcusdt.EMA9[-2]
-                ):
-                    self.logging.info("btc-pulse signaling uptrend")
-                    asyncState.btcbool = False
-                else:
-                    self.logging.info("btc-pulse signaling downtrend")
-                    asyncState.btcbool = True
+            settings = attributes.settings
 
-            else:
-                self.logging.info("btc-pulse signaling uptrend")
-                asyncState.btcbool = False
+            for coin, candles in (await self.btcpulse()).items():
+                self.pulses[coin] = self.trend(
+                    coin, candles, settings.btc_pulse_fallback
+                )
+
+            state = self.combine(settings.btc_pulse_rule)
+            if state is not None and state != asyncState.btcbool:
+                asyncState.btcbool = state
+                self.changed.set()
 
-            self.logging.info("Next btc-pulse check in 5m")
-            await asyncio.sleep(300)
+            self.logging.info(
+                "btc-pulse signaling %s (%s: %s)",
+                "downtrend" if asyncState.btcbool else "uptrend",
+                settings.btc_pulse_rule,
+                Lazy(self.describe),
+            )
+            try:
+                await self.provider.wait()
+            except EOFError as error:
+                # End of a replayed file, the bots keep the last state
+                self.logging.warning(
+                    "btc-pulse stopped, keeping the %s: %s",
+                    "downtrend" if asyncState.btcbool else "uptrend",
+                    error,
+                )
+                return
+
+    def describe(self):
+        return ", ".join(
+            coin + " " + {None: "unknown", True: "down", False: "up"}[state]
+            for coin, state in self.pulses.items()
+        )
@@ -1,11 +1,18 @@
 import re
 import json
-import time
+import weakref
+import asyncio
 
 from signals import Signals
 
 deal_lock = False
 
+# Static payload parts per settings snapshot
+templates = weakref.WeakKeyDictionary()
+deal_gate = None
+# Activations allowed by start() which have not finished yet
+activating = 0
+
 
 class SingleBot:
     def __init__(self, tg_data, bot_data, account_data, attributes, p3cw, logging):
@@ -13,45 +20,42 @@ class SingleBot:
         self.bot_data = bot_data
         self.account_data = account_data
         self.attributes = attributes
+        self.settings = attributes.settings
         self.p3cw = p3cw
         self.logging = logging
         self.signal = Signals(logging)
-        self.prefix = self.attributes.get("prefix")
-        self.subprefix = self.attributes.get("subprefix")
-        self.suffix = self.attributes.get("suffix")
+        self.prefix = self.settings.prefix
+        self.subprefix = self.settings.subprefix
+        self.suffix = self.settings.suffix
         self.bot_name = (
             self.prefix
             + "_"
             + self.subprefix
             + "_"
-            + self.attributes.get("market")
+            + self.settings.market
             + "(.*)"
             + "_"
             + self.suffix
         )
 
     def strategy(self):
-        if self.attributes.get("deal_mode", "signal") == "signal":
+        # deal_mode has already been validated while reading config.ini
+        if self.settings.deal_mode == "signal":
             strategy = [{"strategy": "nonstop"}]
         else:
-            try:
-                strategy = json.loads(self.attributes.get("deal_mode"))
-            except ValueError:
-                self.logging.error(
-                    "Decoding JSON string of deal_mode failed. Please check https://jsonformatter.curiousconcept.com/ for correct format"
-                )
+            strategy = json.loads(self.settings.deal_mode)
 
         return strategy
 
-    def deal_count(self):
+    async def deal_count(self):
         account = self.account_data
         deals = []
 
-        error, data = self.p3cw.request(
+        error, data = await self.p3cw.request(
             entity="deals",
             action="",
             action_id=account["id"],
-            additional_headers={"Forced-Mode": self.attributes.get("trade_mode")},
+            additional_headers={"Forced-Mode": self.settings.trade_mode},
             payload={"limit": 1000, "scope": "active", "account_id": account["id"]},
         )
 
@@ -60,7 +64,7 @@ class SingleBot:
                 "Setting deal count temporary to maximum - because of API errors!"
             )
             self.logging.error(error["msg"])
-            return self.attributes.get("single_count")
+            return self.settings.single_count
         else:
             for deal in data:
                 if re.search(self.bot_name, deal["bot_name"]):
@@ -83,88 +87,107 @@ class SingleBot:
 
         return len(bots)
 
+    def template(self):
+        # Static part of the payload, built once per settings snapshot
+        template = templates.get(self.settings)
+
+        if template is None:
+            template = {
+                "max_active_deals": self.settings.mad,
+                "base_order_volume": self.settings.bo,
+                "take_profit": self.settings.tp,
+                "safety_order_volume": self.settings.so,
+                "martingale_volume_coefficient": self.settings.os,
+                "martingale_step_coefficient": self.settings.ss,
+                "max_safety_orders": self.settings.mstc,
+                "safety_order_step_percentage": self.settings.sos,
+                "take_profit_type": "total",
+                "active_safety_orders_count": self.settings.max,
+                "cooldown": self.settings.cooldown,
+                "strategy_list": self.strategy(),
+                "trailing_enabled": self.settings.trailing,
+                "trailing_deviation": self.settings.trailing_deviation,
+                "min_volume_btc_24h": self.settings.btc_min_vol,
+                "disable_after_deals_count": self.settings.deals_count,
+            }
+
+            if self.settings.trade_future:
+                template.update(
+                    {
+                        "leverage_type": self.settings.leverage_type,
+                        "leverage_custom_value": self.settings.leverage_value,
+                        "stop_loss_percentage": self.settings.stop_loss_percent,
+                        "stop_loss_type": self.settings.stop_loss_type,
+                        "stop_loss_timeout_enabled": self.settings.stop_loss_timeout_enabled,
+                        "stop_loss_timeout_in_seconds": self.settings.stop_loss_timeout_seconds,
+                    }
+                )
+
+            templates[self.settings] = template
+
+        return template
+
     def payload(self, pair, new_bot):
-        payload = {
-            "name": self.prefix + "_" + self.subprefix + "_" + pair + "_" + self.suffix,
-            "account_id": self.account_data["id"],
-            "pairs": self.tg_data["pair"],
-            "max_active_deals": self.attributes.get("mad"),
-            "base_order_volume": self.attributes.get("bo"),
-            "take_profit": self.attributes.get("tp"),
-            "safety_order_volume": self.attributes.get("so"),
-            "martingale_volume_coefficient": self.attributes.get("os"),
-            "martingale_step_coefficient": self.attributes.get("ss"),
-            "max_safety_orders": self.attributes.get("mstc"),
-            "safety_order_step_percentage": self.attributes.get("sos"),
-            "take_profit_type": "total",
-            "active_safety_orders_count": self.attributes.get("max"),
-            "cooldown": self.attributes.get("cooldown", 0),
-            "strategy_list": self.strategy(),
-            "trailing_enabled": self.attributes.get("trailing", False),
-            "trailing_deviation": self.attributes.get("trailing_deviation", 0.2),
-            "min_volume_btc_24h": self.attributes.get("btc_min_vol"),
-            "disable_after_deals_count": self.attributes.get("deals_count", 0),
-        }
-        
+        name = self.prefix + "_" + self.subprefix + "_" + pair + "_" + self.suffix
+
+        payload = dict(self.template())
+        payload.update(
+            {
+                "name": name,
+                "account_id": self.account_data["id"],
+                "pairs": self.tg_data.pair,
+            }
+        )
+
         if new_bot:
             if payload["disable_after_deals_count"] == 0:
-                self.logging.info("This is a new bot and deal_count set to 0, removing from payload")
+                self.logging.info(
+                    "This is a new bot and deal_count set to 0, removing from payload"
+                )
                 payload.pop("disable_after_deals_count")
 
-        if self.attributes.get("trade_future", False):
-            payload.update(
-                {
-                    "leverage_type": self.attributes.get("leverage_type"),
-                    "leverage_custom_value": self.attributes.get("leverage_value"),
-                    "stop_loss_percentage": self.attributes.get("stop_loss_percent"),
-                    "stop_loss_type": self.attributes.get("stop_loss_type"),
-                    "stop_loss_timeout_enabled": self.attributes.get(
-                        "stop_loss_timeout_enabled"
-                    ),
-                    "stop_loss_timeout_in_seconds": self.attributes.get(
-                        "stop_loss_timeout_seconds"
-                    ),
-                }
-            )
-
         return payload
 
-    def update(self, bot):
+    async def update(self, bot):
         # Update settings on an existing bot
         self.logging.info("Updating bot settings on " + bot["name"])
 
-        error, data = self.p3cw.request(
+        error, data = await self.p3cw.request(
             entity="bots",
             action="update",
             action_id=str(bot["id"]),
-            additional_headers={"Forced-Mode": self.attributes.get("trade_mode")},
+            additional_headers={"Forced-Mode": self.settings.trade_mode},
             payload=self.payload(bot["pairs"][0], new_bot=False),
         )
 
         if error:
             self.logging.error(error["msg"])
+        else:
+            self.bot_data.update(data)
 
-    def enable(self, bot):
+    async def enable(self, bot):
 
         self.logging.info(
             "Enabling single bot " + bot["name"] + " because of a START signal"
         )
 
-        if self.attributes.get("singlebot_update", "true"):
-            self.update(bot)
+        if self.settings.singlebot_update:
+            await self.update(bot)
 
         # Enables an existing bot
-        error, data = self.p3cw.request(
+        error, data = await self.p3cw.request(
             entity="bots",
             action="enable",
             action_id=str(bot["id"]),
-            additional_headers={"Forced-Mode": self.attributes.get("trade_mode")},
+            additional_headers={"Forced-Mode": self.settings.trade_mode},
         )
 
         if error:
             self.logging.error(error["msg"])
+        else:
+            self.bot_data.update(data)
 
-    def disable(self, bot, allbots=False):
+    async def disable(self, bot, allbots=False):
         # Disable all bots
         error = {}
 
@@ -174,11 +197,7 @@ class SingleBot:
 
             for bots in bot:
                 if (
-                    self.prefix
-                    + "_"
-                    + self.subprefix
-                    + "_"
-                    + self.attributes.get("market")
+                    self.prefix + "_" + self.subprefix + "_" + self.settings.market
                 ) in bots["name"]:
 
                     self.logging.info(
@@ -187,101 +206,137 @@ class SingleBot:
                         + " because of a STOP signal"
                     )
 
-                    error, data = self.p3cw.request(
+                    error, data = await self.p3cw.request(
                         entity="bots",
                         action="disable",
                         action_id=str(bots["id"]),
-                        additional_headers={
-                            "Forced-Mode": self.attributes.get("trade_mode")
-                        },
+                        additional_headers={"Forced-Mode": self.settings.trade_mode},
                     )
 
                     if error:
                         self.logging.error(error["msg"])
+                    else:
+                        self.bot_data.update(data)
         else:
             # Disables an existing bot
             self.logging.info(
                 "Disabling single bot " + bot["name"] + " because of a STOP signal"
             )
 
-            error, data = self.p3cw.request(
+            error, data = await self.p3cw.request(
                 entity="bots",
                 action="disable",
                 action_id=str(bot["id"]),
-                additional_headers={"Forced-Mode": self.attributes.get("trade_mode")},
+                additional_headers={"Forced-Mode": self.settings.trade_mode},
             )
 
             if error:
                 self.logging.error(error["msg"])
+            else:
+                self.bot_data.update(data)
 
-    def create(self):
+    async def create(self):
         # Creates a single bot with start signal
-        self.logging.info("Create single bot with pair " + self.tg_data["pair"])
+        self.logging.info("Create single bot with pair " + self.tg_data.pair)
 
-        error, data = self.p3cw.request(
+        error, data = await self.p3cw.request(
             entity="bots",
             action="create_bot",
-            additional_headers={"Forced-Mode": self.attributes.get("trade_mode")},
-            payload=self.payload(self.tg_data["pair"], new_bot=True),
+            additional_headers={"Forced-Mode": self.settings.trade_mode},
+            payload=self.payload(self.tg_data.pair, new_bot=True),
         )
 
         if error:
             self.logging.error(error["msg"])
         else:
+            self.bot_data.update(data)
             # Fix - 3commas needs some time for bot creation
-            time.sleep(2)
-            self.enable(data)
+            await asyncio.sleep(2)
+            await self.enable(data)
 
-    def delete(self, bot):
-        if bot["active_deals_count"] == 0 and self.attributes.get(
-            "delete_single_bots", False
-        ):
+    async def delete(self, bot):
+        if bot["active_deals_count"] == 0 and self.settings.delete_single_bots:
             # Deletes a single bot with stop signal
-            self.logging.info("Delete single bot with pair " + self.tg_data["pair"])
-            error, data = self.p3cw.request(
+            self.logging.info("Delete single bot with pair " + self.tg_data.pair)
+            error, data = await self.p3cw.request(
                 entity="bots",
                 action="delete",
                 action_id=str(bot["id"]),
-                additional_headers={"Forced-Mode": self.attributes.get("trade_mode")},
+                additional_headers={"Forced-Mode": self.settings.trade_mode},
             )
 
             if error:
                 self.logging.error(error["msg"])
+            else:
+                self.bot_data.remove(bot)
         else:
             self.logging.info(
                 "Cannot delete single bot, because of active deals or configuration. Disabling it!"
             )
-            self.disable(bot, False)
+            await self.disable(bot, False)
+
+    async def start(self, activate):
+        # Runs activate (create or enable) if the deal limits allow it. Signals for
+        # different pairs are processed in parallel, so the checks reserve a slot
+        # under one lock to not exceed single_count. The activation itself runs
+        # outside of the lock and counts as enabled bot and deal until it is done
+        global deal_lock, deal_gate, activating
+
+        if deal_gate is None:
+            deal_gate = asyncio.Lock()
+
+        async with deal_gate:
+            if self.bot_count() + activating >= self.settings.single_count:
+                self.logging.info(
+                    "Maximum bots/deals reached. Bot with pair: "
+                    + self.tg_data.pair
+                    + " not started."
+                )
+                return
+
+            running_deals = await self.deal_count() + activating
+
+            # avoid deals over limit
+            if running_deals < self.settings.single_count - 1:
+                deal_lock = False
+            elif (running_deals == self.settings.single_count - 1) and not deal_lock:
+                deal_lock = True
+            else:
+                self.logging.info(
+                    "Blocking new deals, because last enabled bot can potentially reach max deals!"
+                )
+                return
+
+            activating += 1
+
+        try:
+            await activate()
+        finally:
+            activating -= 1
 
-    def trigger(self):
+    async def trigger(self):
         # Triggers a single bot deal
 
         self.logging.info("Got new 3cqs signal")
 
-        global deal_lock
-        new_bot = True
-        pair = self.tg_data["pair"]
-        running_deals = self.deal_count()
+        pair = self.tg_data.pair
 
         if self.bot_data:
-            for bot in self.bot_data:
-                if (
-                    self.prefix + "_" + self.subprefix + "_" + pair + "_" + self.suffix
-                ) == bot["name"]:
-                    new_bot = False
-                    break
+            bot = self.bot_data.get(
+                self.prefix + "_" + self.subprefix + "_" + pair + "_" + self.suffix
+            )
 
-            if new_bot:
-                if self.tg_data["action"] == "START":
-                    if self.bot_count() < self.attributes.get("single_count"):
+            if not bot:
+                if self.tg_data.action == "START":
+                    if self.bot_count() < self.settings.single_count:
 
-                        if self.attributes.get("topcoin_filter", False):
-                            pair = self.signal.topcoin(
+                        if self.settings.topcoin_filter:
+                            pair = await self.signal.topcoin_async(
                                 pair,
-                                self.attributes.get("topcoin_limit", 0),
-                                self.attributes.get("topcoin_volume", 0),
-                                self.attributes.get("topcoin_exchange", "binance"),
-                                self.attributes.get("market"),
+                                self.settings.topcoin_limit,
+                                self.settings.topcoin_volume,
+                                self.settings.topcoin_exchange,
+                                self.settings.market,
                             )
                         else:
                             self.logging.info(
@@ -292,24 +347,11 @@ class SingleBot:
                             self.logging.info(
                                 "No single bot for " + pair + " found - creating one"
                             )
-                            # avoid deals over limit
-                            if running_deals < self.attributes.get("single_count") - 1:
-                                self.create()
-                                deal_lock = False
-                            elif (
-                                running_deals == self.attributes.get("single_count") - 1
-                            ) and not deal_lock:
-                                self.create()
-                                deal_lock = True
-                            else:
-                                self.logging.info(
-                                    "Blocking new deals, because last enabled bot can potentially reach max deals!"
-                                )
-
+                            await self.start(self.create)
                         else:
                             self.logging.info(
                                 "Pair "
-                                + str(self.tg_data["pair"])
+                                + str(self.tg_data.pair)
                                 + " is not in the top coin list - not added!"
                             )
                     else:
@@ -319,7 +361,7 @@ class SingleBot:
                             + " not added."
                         )
 
-                elif self.tg_data["action"] == "STOP":
+                elif self.tg_data.action == "STOP":
                     self.logging.info(
                         "Stop command on a non-existing single bot with pair: " + pair
                     )
@@ -327,22 +369,9 @@ class SingleBot:
                 self.logging.debug("Pair: " + pair)
                 self.logging.debug("Bot-Name: " + bot["name"])
 
-                if self.tg_data["action"] == "START":
-                    if self.bot_count() < self.attributes.get("single_count"):
-                        # avoid deals over limit
-                        if self.deal_count() < self.attributes.get("single_count") - 1:
-                            self.enable(bot)
-                            deal_lock = False
-                        elif (
-                            self.deal_count() == self.attributes.get("single_count") - 1
-                        ) and not deal_lock:
-                            self.enable(bot)
-                            deal_lock = True
-                        else:
-                            self.logging.info(
-                                "Blocking new deals, because last enabled bot can potentially reach max deals!"
-                            )
-
+                if self.tg_data.action == "START":
+                    if self.bot_count() < self.settings.single_count:
+                        await self.start(lambda: self.enable(bot))
                     else:
                         self.logging.info(
                             "Maximum enabled bots/deals reached. Single bot with pair: "
@@ -350,8 +379,8 @@ class SingleBot:
                             + " not enabled."
                         )
                 else:
-                    self.delete(bot)
+                    await self.delete(bot)
 
         else:
             self.logging.info("No single bots found")
-            self.create()
+            await self.start(self.create)
@@ -8,6 +8,10 @@ echo "[general]" > config.ini
 [ $LOGFILEPATH ] && echo "log_file_path = $LOGFILEPATH" >> config.ini
 [ $LOGFILESIZE ] && echo "log_file_size = $LOGFILESIZE" >> config.ini
 [ $LOGFILECOUNT ] && echo "log_file_count = $LOGFILECOUNT" >> config.ini
+[ $LOGFORMAT ] && echo "log_format = $LOGFORMAT" >> config.ini
+[ $SIGNALLOG ] && echo "signal_log = $SIGNALLOG" >> config.ini
+[ $CACHEFILE ] && echo "cache_file = $CACHEFILE" >> config.ini
+[ $CONFIG_RELOAD_INTERVAL ] && echo "config_reload_interval = $CONFIG_RELOAD_INTERVAL" >> config.ini
 
 # Telegram settings
 echo "[telegram]" >> config.ini
@@ -24,6 +28,13 @@ echo "[commas]" >> config.ini
 [ $API_RETRIES ] && echo "retries = $API_RETRIES" >> config.ini
 [ $API_RETRY_DELAY ] && echo "delay_between_retries = $API_RETRY_DELAY" >> config.ini
 [ $SYS_BOT_VALUE ] && echo "system_bot_value = $SYS_BOT_VALUE" >> config.ini
+[ $API_WORKERS ] && echo "api_workers = $API_WORKERS" >> config.ini
+[ $BOT_REFRESH_INTERVAL ] && echo "bot_refresh_interval = $BOT_REFRESH_INTERVAL" >> config.ini
+[ $BOT_FULL_REFRESH_INTERVAL ] && echo "bot_full_refresh_interval = $BOT_FULL_REFRESH_INTERVAL" >> config.ini
+[ $BOT_FETCH_CONCURRENCY ] && echo "bot_fetch_concurrency = $BOT_FETCH_CONCURRENCY" >> config.ini
+[ $SIGNAL_WORKERS ] && echo "signal_workers = $SIGNAL_WORKERS" >> config.ini
+[ $SIGNAL_QUEUE_SIZE ] && echo "signal_queue_size = $SIGNAL_QUEUE_SIZE" >> config.ini
+[ $SIGNAL_QUEUE_STATS_INTERVAL ] && echo "signal_queue_stats_interval = $SIGNAL_QUEUE_STATS_INTERVAL" >> config.ini
 
 # DCABOT settings
 echo "[dcabot]" >> config.ini
@@ -68,10 +79,18 @@ echo "[filter]" >> config.ini
 [ $TOPCOIN_LIMIT ] && echo "topcoin_limit = $TOPCOIN_LIMIT" >> config.ini
 [ $TOPCOIN_VOLUME ] && echo "topcoin_volume = $TOPCOIN_VOLUME" >> config.ini
 [ $TOPCOIN_EXCHANGE ] && echo "topcoin_exchange = $TOPCOIN_EXCHANGE" >> config.ini
+[ $CGRATELIMIT ] && echo "coingecko_rate_limit = $CGRATELIMIT" >> config.ini
+[ $TCCACHE ] && echo "topcoin_cache = $TCCACHE" >> config.ini
 [ "$DEAL_MODE" ] && echo "deal_mode = ${DEAL_MODE}"  >> config.ini
 [ $LIMIT_INIT_PAIRS ] && echo "limit_init_pairs = $LIMIT_INIT_PAIRS" >> config.ini
 [ $RANDOM_PAIR ] && echo "random_pair = $RANDOM_PAIR" >> config.ini
+[ $MULTIBOT_UPDATE_WINDOW ] && echo "multibot_update_window = $MULTIBOT_UPDATE_WINDOW" >> config.ini
 [ $BTC_PULSE ] && echo "btc_pulse = $BTC_PULSE" >> config.ini
+[ $BTC_PULSE_FALLBACK ] && echo "btc_pulse_fallback = $BTC_PULSE_FALLBACK" >> config.ini
+[ $BTC_PULSE_SOURCE ] && echo "btc_pulse_source = $BTC_PULSE_SOURCE" >> config.ini
+[ $BTC_PULSE_SYMBOLS ] && echo "btc_pulse_symbols = $BTC_PULSE_SYMBOLS" >> config.ini
+[ $BTC_PULSE_RULE ] && echo "btc_pulse_rule = $BTC_PULSE_RULE" >> config.ini
+[ $BTC_PULSE_DEBOUNCE ] && echo "btc_pulse_debounce = $BTC_PULSE_DEBOUNCE" >> config.ini
 [ $EXT_BOTSWITCH ] && echo "ext_botswitch = $EXT_BOTSWITCH" >> config.ini
 [ "$DENYLIST" ] && echo "token_denylist = $DENYLIST" >> config.ini
 
@@ -0,0 +1,100 @@
+import re
+
+from typing import NamedTuple, Optional
+
+# Signal titles of 3CQS mapped to the names used in symrank_signal
+TITLES = {
+    "SymRank Top 30": "top30",
+    "SymRank Top 100 Triple Tracker": "triple100",
+    "SymRank Top 100 Quadruple Tracker": "quad100",
+    "SymRank Top 250 Quadruple Tracker": "quad250",
+    "Super Volatility": "svol",
+    "Super Volatility Double Tracker": "svoldouble",
+    "Hyper Volatility": "hvol",
+    "Hyper Volatility Double Tracker": "hvoldouble",
+    "Ultra Volatility": "uvol",
+    "X-treme Volatility": "xvol",
+}
+
+# Value of scores marked as N/A by 3CQS
+NOT_AVAILABLE = 9999999
+
+# A signal has exactly 7 lines, a symrank list exactly 17
+SIGNAL_LINES = 7
+SYMRANK_LINES = 17
+
+SIGNAL = re.compile(
+    r"[^\n]*\n"
+    r"(?P<title>[^\n]*)\n"
+    r"#?(?P<token>[^\n]+)\n"
+    r"BOT_(?P<action>[^\n]+)\n"
+    r"Volatility Score (?P<volatility>[^\n]+)\n"
+    r"Price Action Score (?P<price_action>[^\n]+)\n"
+    r"SymRank #(?P<symrank>[^\n]+)"
+)
+
+SYMRANK = re.compile(r"(\d+)\. +(\S+)")
+
+
+class Signal(NamedTuple):
+    title: str
+    signal: Optional[str]
+    pair: str
+    action: str
+    volatility: float
+    price_action: float
+    symrank: int
+
+
+def score(value, kind):
+    if value == "N/A":
+        return kind(NOT_AVAILABLE)
+
+    return kind(value)
+
+
+def parse(raw_text, market):
+    """Parses a 3CQS Telegram message
+
+    Parameters:
+    raw_text (str): Message text
+    market (str): Trading market used as pair prefix (e.g. USDT)
+
+    Returns:
+    Signal: for a START/STOP signal (signal is None for unknown titles)
+    list: tokens of a symrank list ordered by rank (empty for volatility lists)
+    None: for every other message
+
+    """
+
+    # Cheap rejection of chat messages before splitting anything
+    lines = raw_text.count("\n") + 1
+
+    if lines == SIGNAL_LINES:
+        match = SIGNAL.fullmatch(raw_text)
+
+        if not match:
+            return None
+
+        try:
+            return Signal(
+                title=match["title"],
+                signal=TITLES.get(match["title"]),
+                pair=market + "_" + match["token"].replace("#", ""),
+                action=match["action"],
+                volatility=score(match["volatility"], float),
+                price_action=score(match["price_action"], float),
+                symrank=score(match["symrank"], int),
+            )
+        except ValueError:
+            return None
+
+    elif lines == SYMRANK_LINES:
+        if "Volatile" in raw_text[: raw_text.index("\n")]:
+            return []
+
+        pairs = {int(rank): token for rank, token in SYMRANK.findall(raw_text)}
+
+        return [pairs[rank] for rank in sorted(pairs)]
+
+    return None